@@ -0,0 +1,58 @@
+import os
+import pygame as p
+
+# Piece sprites packed into one atlas per square size. The first launch with a
+# size scales the PNGs of pixel_chess/pieces into the atlas and stores its raw
+# RGBA pixels in pixel_chess/cache, later launches read that file back without
+# decoding or scaling anything. The sprites are subsurfaces of the atlas in the
+# display format, so blitting them doesn't convert pixels.
+#
+# pixel_chess/boards isn't packed, the board is drawn from plain squares.
+
+pieceNames = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+sourceDirectory = os.path.join('pixel_chess', 'pieces')
+cacheDirectory = os.path.join('pixel_chess', 'cache')
+
+# size: {name: sprite}, filled when a size is first asked for
+spriteCache = {}
+
+def getCachePath(size):
+    return os.path.join(cacheDirectory, 'pieces_{}.rgba'.format(size))
+
+def isCacheValid(path):
+    # the cache is older than a source image when an image was replaced
+    if not os.path.exists(path):
+        return False
+    cacheTime = os.path.getmtime(path)
+    return all(os.path.getmtime(os.path.join(sourceDirectory, name + '.png')) <= cacheTime for name in pieceNames)
+
+def buildAtlas(size):
+    atlas = p.Surface((size * len(pieceNames), size), p.SRCALPHA)
+    for i, name in enumerate(pieceNames):
+        image = p.image.load(os.path.join(sourceDirectory, name + '.png'))
+        atlas.blit(p.transform.scale(image, (size, size)), (i * size, 0))
+    return atlas
+
+def loadAtlas(size):
+    path = getCachePath(size)
+    if isCacheValid(path):
+        with open(path, 'rb') as stream:
+            return p.image.frombytes(stream.read(), (size * len(pieceNames), size), 'RGBA')
+    atlas = buildAtlas(size)
+    try:
+        os.makedirs(cacheDirectory, exist_ok=True)
+        # written to a temporary file first, so a cache file is never half written
+        with open(path + '.tmp', 'wb') as stream:
+            stream.write(p.image.tobytes(atlas, 'RGBA'))
+        os.replace(path + '.tmp', path)
+    except OSError:
+        # a read-only install still works, it just builds the atlas every launch
+        pass
+    return atlas
+
+def getSprites(size):
+    # {piece name: surface of size x size}, the display mode has to be set
+    if size not in spriteCache:
+        atlas = loadAtlas(size).convert_alpha()
+        spriteCache[size] = {name: atlas.subsurface(p.Rect(i * size, 0, size, size)) for i, name in enumerate(pieceNames)}
+    return spriteCache[size]
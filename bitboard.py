@@ -0,0 +1,744 @@
+import zobrist
+import psqt
+from pieces import QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EP_CAPTURE, PROMOTION
+from pieces import ranksToRows, filesToCols, getChessNotation, createFen
+from pieces import ONGOING, CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT_MATERIAL
+
+# Bitboard backend for the rules engine, it exposes the same interface as game.GameState
+# (whiteToMove, moveLog, inCheck, gameOver, subscribe, makeMove, undoMove,
+# getValidMoves, getAllPlayerMoves) but keeps the position in 64 bit integers.
+#
+# Squares are numbered like the object board, square = row * 8 + col, so 0 is a8 and
+# 63 is h1. Bit n of every bitboard stands for square n.
+#
+# Moves are the packed integers of pieces.encodeMove, a move has the same number in both backends.
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+# piece index = color * 6 + piece type
+pieceNames = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+pieceIndex = {name: i for i, name in enumerate(pieceNames)}
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# kinds of moves for generateMoves, noisy moves are captures, en passant and
+# every promotion, quiet moves all the others
+NOISY_MOVES, QUIET_MOVES = 1, 2
+ALL_MOVES = NOISY_MOVES | QUIET_MOVES
+
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+RANK_8 = 0xFF
+RANK_1 = RANK_8 << 56
+RANK_6 = RANK_8 << 16
+RANK_3 = RANK_8 << 40
+# a8 is a light square
+LIGHT_SQUARES = sum(1 << sq for sq in range(64) if ((sq >> 3) + (sq & 7)) % 2 == 0)
+DARK_SQUARES = FULL ^ LIGHT_SQUARES
+
+startBoard = [
+    ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
+    ['bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp'],
+    ['--', '--', '--', '--', '--', '--', '--', '--'],
+    ['--', '--', '--', '--', '--', '--', '--', '--'],
+    ['--', '--', '--', '--', '--', '--', '--', '--'],
+    ['--', '--', '--', '--', '--', '--', '--', '--'],
+    ['wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp'],
+    ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
+]
+
+def createTable(directions):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for i, j in directions:
+            if 0 <= r + i <= 7 and 0 <= c + j <= 7:
+                bb |= 1 << ((r + i) * 8 + c + j)
+        table.append(bb)
+    return table
+
+def createRays(direction):
+    rays = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        i, j = direction
+        bb = 0
+        while 0 <= r + i <= 7 and 0 <= c + j <= 7:
+            bb |= 1 << ((r + i) * 8 + c + j)
+            i += direction[0]
+            j += direction[1]
+        rays.append(bb)
+    return rays
+
+KNIGHT_ATTACKS = createTable(((1,2),(-1,2),(1,-2),(-1,-2),(2,1),(-2,1),(2,-1),(-2,-1)))
+KING_ATTACKS = createTable(((1, 1), (-1, 1), (1, -1), (-1, -1), (1,0), (-1,0), (0,1), (0,-1)))
+# squares attacked by a pawn of each color standing on the square
+PAWN_ATTACKS = [createTable(((-1, -1), (-1, 1))), createTable(((1, -1), (1, 1)))]
+
+# Rays growing towards higher squares are cut at their lowest blocker,
+# rays growing towards lower squares at their highest blocker
+ROOK_RAYS_UP = [createRays(d) for d in ((1, 0), (0, 1))]
+ROOK_RAYS_DOWN = [createRays(d) for d in ((-1, 0), (0, -1))]
+BISHOP_RAYS_UP = [createRays(d) for d in ((1, 1), (1, -1))]
+BISHOP_RAYS_DOWN = [createRays(d) for d in ((-1, 1), (-1, -1))]
+
+def createLines():
+    # between[a][b] holds the squares strictly between two aligned squares,
+    # line[a][b] the whole board line through both of them
+    between = [[0] * 64 for sq in range(64)]
+    line = [[0] * 64 for sq in range(64)]
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for i, j in ((1, 1), (-1, 1), (1, -1), (-1, -1), (1,0), (-1,0), (0,1), (0,-1)):
+            full = createRays((i, j))[sq] | createRays((-i, -j))[sq] | (1 << sq)
+            squares = 0
+            row, col = r + i, c + j
+            while 0 <= row <= 7 and 0 <= col <= 7:
+                between[sq][row * 8 + col] = squares
+                line[sq][row * 8 + col] = full
+                squares |= 1 << (row * 8 + col)
+                row += i
+                col += j
+    return between, line
+
+BETWEEN, LINE = createLines()
+
+PIECE_KEYS = [zobrist.pieceKeys[name] for name in pieceNames]
+MIDDLEGAME_SCORES = [psqt.middlegameScores[name] for name in pieceNames]
+ENDGAME_SCORES = [psqt.endgameScores[name] for name in pieceNames]
+PHASE_WEIGHTS = [psqt.phaseWeights[name[1]] for name in pieceNames]
+
+# castling rights that survive a move from or to each square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[0] = 15 ^ BLACK_QUEENSIDE
+CASTLING_MASK[4] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[7] = 15 ^ BLACK_KINGSIDE
+CASTLING_MASK[56] = 15 ^ WHITE_QUEENSIDE
+CASTLING_MASK[60] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[63] = 15 ^ WHITE_KINGSIDE
+
+def slidingAttacks(sq, occupied, raysUp, raysDown):
+    attacks = 0
+    for rays in raysUp:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in raysDown:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+def unpackPosition(packed):
+    # rebuilds a position from BitboardGameState.packPosition, without its move history
+    position = BitboardGameState()
+    bitboards, position.whiteToMove, position.castling, position.enPassant = packed
+    position.bitboards = list(bitboards)
+    position.occupancy = [0, 0]
+    position.squares = [-1] * 64
+    for piece in range(12):
+        bb = bitboards[piece]
+        position.occupancy[piece // 6] |= bb
+        while bb:
+            lsb = bb & -bb
+            bb ^= lsb
+            position.squares[lsb.bit_length() - 1] = piece
+    position.zobristKey = position.computeHash()
+    position.computeScores()
+    return position
+
+class BitboardGameState():
+
+    def __init__(self, fen=None):
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        # piece index on every square, -1 for an empty square
+        self.squares = [-1] * 64
+        for r in range(8):
+            for c in range(8):
+                if startBoard[r][c] != '--':
+                    self.putPiece(pieceIndex[startBoard[r][c]], r * 8 + c)
+        self.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.enPassant = -1
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        self.history = []
+        self.moveLog = []
+        self.whiteToMove = True
+        self.inCheck = False
+        self.gameOver = False
+        self.result = ONGOING
+        self.listeners = []
+        self.startFen = fen
+        if fen != None:
+            self.loadFen(fen)
+        self.zobristKey = self.computeHash()
+        self.computeScores()
+
+    def loadFen(self, fen):
+        self.startFen = fen
+        # a FEN from outside (uci.py, server.py) may be anything, it raises ValueError
+        # unless it gives a position the move generation can work on
+        fields = fen.split()
+        if len(fields) < 2 or len(fields[0].split('/')) != 8 or fields[1] not in ('w', 'b'):
+            raise ValueError('bad FEN {}'.format(fen))
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.squares = [-1] * 64
+        for r, row in enumerate(fields[0].split('/')):
+            c = 0
+            for char in row:
+                if char in '12345678':
+                    c += int(char)
+                    continue
+                if char not in 'pnbrqkPNBRQK' or c > 7:
+                    raise ValueError('bad FEN {}'.format(fen))
+                color = 'w' if char.isupper() else 'b'
+                name = 'p' if char in 'pP' else char.upper()
+                self.putPiece(pieceIndex[color + name], r * 8 + c)
+                c += 1
+            if c != 8:
+                raise ValueError('bad FEN {}'.format(fen))
+        self.whiteToMove = fields[1] == 'w'
+        moved = BLACK if self.whiteToMove else WHITE
+        if self.bitboards[KING].bit_count() != 1 or self.bitboards[6 + KING].bit_count() != 1 \
+                or self.isSquareAttacked(self.kingSquare(moved), moved ^ 1):
+            raise ValueError('illegal position {}'.format(fen))
+        castling = fields[2] if len(fields) > 2 else '-'
+        self.castling = 0
+        for right, flag in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE), ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE)):
+            if right in castling:
+                self.castling |= flag
+        passant = fields[3] if len(fields) > 3 else '-'
+        if passant != '-':
+            if len(passant) != 2 or passant[0] not in filesToCols or passant[1] != ('6' if self.whiteToMove else '3'):
+                raise ValueError('bad FEN {}'.format(fen))
+            self.enPassant = ranksToRows[passant[1]] * 8 + filesToCols[passant[0]]
+        else:
+            self.enPassant = -1
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        self.history = []
+        self.moveLog = []
+        self.zobristKey = self.computeHash()
+        self.computeScores()
+
+    def getFen(self):
+        names = [pieceNames[piece] if piece != -1 else None for piece in self.squares]
+        return createFen(names, self.whiteToMove, self.castling, self.enPassant, self.halfmoveClock, self.fullmoveNumber)
+
+    def copy(self):
+        # independent copy of the position without listeners, for searching
+        position = BitboardGameState.__new__(BitboardGameState)
+        position.__dict__.update(self.__dict__)
+        position.bitboards = self.bitboards[:]
+        position.occupancy = self.occupancy[:]
+        position.squares = self.squares[:]
+        position.history = self.history[:]
+        position.moveLog = self.moveLog[:]
+        position.listeners = []
+        return position
+
+    def packPosition(self):
+        # small picklable tuple to send the position to another process
+        return (tuple(self.bitboards), self.whiteToMove, self.castling, self.enPassant)
+
+    def findMove(self, notation):
+        for move in self.getValidMoves():
+            if getChessNotation(move) == notation:
+                return move
+        return None
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
+
+    def getEnPassantKey(self):
+        # the en passant square only changes the position if a pawn can capture on it
+        if self.enPassant == -1:
+            return 0
+        color = WHITE if self.whiteToMove else BLACK
+        if PAWN_ATTACKS[color ^ 1][self.enPassant] & self.bitboards[color * 6 + PAWN]:
+            return zobrist.enPassantKeys[self.enPassant % 8]
+        return 0
+
+    def computeHash(self):
+        key = zobrist.castlingKeys[self.castling] ^ self.getEnPassantKey()
+        if not self.whiteToMove:
+            key ^= zobrist.sideKey
+        for sq in range(64):
+            if self.squares[sq] != -1:
+                key ^= PIECE_KEYS[self.squares[sq]][sq]
+        return key
+
+    def computeScores(self):
+        # sums of the piece-square scores and the phase, see psqt.py
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+        for sq in range(64):
+            piece = self.squares[sq]
+            if piece != -1:
+                self.middlegame += MIDDLEGAME_SCORES[piece][sq]
+                self.endgame += ENDGAME_SCORES[piece][sq]
+                self.phase += PHASE_WEIGHTS[piece]
+
+    def putPiece(self, piece, sq):
+        self.bitboards[piece] |= 1 << sq
+        self.occupancy[piece // 6] |= 1 << sq
+        self.squares[sq] = piece
+
+    def getLastMove(self):
+        if len(self.moveLog) != 0:
+            return self.moveLog[-1]
+        return None
+
+    def makeMove(self, move):
+        self.pushMove(move)
+        self.moveLog.append(move)
+        self.notify('makeMove', move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog.pop()
+            self.popMove(move)
+            self.gameOver = False
+            self.result = ONGOING
+            self.notify('undoMove', move)
+
+    def pushMove(self, move):
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        squares = self.squares
+        color = WHITE if self.whiteToMove else BLACK
+        piece = squares[start]
+        captured = squares[end]
+        self.history.append((captured, self.castling, self.enPassant, self.zobristKey, self.halfmoveClock,
+                             self.middlegame, self.endgame, self.phase))
+        # the clock counts the moves since the last capture or pawn move
+        self.halfmoveClock = 0 if captured != -1 or piece % 6 == PAWN else self.halfmoveClock + 1
+        if color == BLACK:
+            self.fullmoveNumber += 1
+        key = self.zobristKey ^ zobrist.castlingKeys[self.castling] ^ self.getEnPassantKey() ^ zobrist.sideKey
+        key ^= PIECE_KEYS[piece][start]
+        middlegame = self.middlegame - MIDDLEGAME_SCORES[piece][start]
+        endgame = self.endgame - ENDGAME_SCORES[piece][start]
+
+        startEnd = (1 << start) | (1 << end)
+        if captured != -1:
+            bitboards[captured] ^= 1 << end
+            occupancy[color ^ 1] ^= 1 << end
+            key ^= PIECE_KEYS[captured][end]
+            middlegame -= MIDDLEGAME_SCORES[captured][end]
+            endgame -= ENDGAME_SCORES[captured][end]
+            self.phase -= PHASE_WEIGHTS[captured]
+        elif flag == EP_CAPTURE:
+            passant = end + 8 if color == WHITE else end - 8
+            bitboards[(color ^ 1) * 6 + PAWN] ^= 1 << passant
+            occupancy[color ^ 1] ^= 1 << passant
+            squares[passant] = -1
+            key ^= PIECE_KEYS[(color ^ 1) * 6 + PAWN][passant]
+            middlegame -= MIDDLEGAME_SCORES[(color ^ 1) * 6 + PAWN][passant]
+            endgame -= ENDGAME_SCORES[(color ^ 1) * 6 + PAWN][passant]
+        bitboards[piece] ^= startEnd
+        occupancy[color] ^= startEnd
+        squares[start] = -1
+        squares[end] = piece
+
+        if flag & PROMOTION:
+            promoted = color * 6 + (flag & 3) + 1
+            bitboards[piece] ^= 1 << end
+            bitboards[promoted] ^= 1 << end
+            squares[end] = promoted
+            key ^= PIECE_KEYS[promoted][end]
+            middlegame += MIDDLEGAME_SCORES[promoted][end]
+            endgame += ENDGAME_SCORES[promoted][end]
+            self.phase += PHASE_WEIGHTS[promoted]
+        else:
+            key ^= PIECE_KEYS[piece][end]
+            middlegame += MIDDLEGAME_SCORES[piece][end]
+            endgame += ENDGAME_SCORES[piece][end]
+            if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+                rook = color * 6 + ROOK
+                rookStart, rookEnd = (end + 1, end - 1) if flag == KING_CASTLE else (end - 2, end + 1)
+                self.moveRook(rook, rookStart, rookEnd)
+                key ^= PIECE_KEYS[rook][rookStart] ^ PIECE_KEYS[rook][rookEnd]
+                middlegame += MIDDLEGAME_SCORES[rook][rookEnd] - MIDDLEGAME_SCORES[rook][rookStart]
+                endgame += ENDGAME_SCORES[rook][rookEnd] - ENDGAME_SCORES[rook][rookStart]
+
+        self.castling &= CASTLING_MASK[start] & CASTLING_MASK[end]
+        self.enPassant = (start + end) // 2 if flag == DOUBLE_PUSH else -1
+        self.middlegame = middlegame
+        self.endgame = endgame
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey = key ^ zobrist.castlingKeys[self.castling] ^ self.getEnPassantKey()
+
+    def popMove(self, move):
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        squares = self.squares
+        self.whiteToMove = not self.whiteToMove
+        color = WHITE if self.whiteToMove else BLACK
+        captured, self.castling, self.enPassant, self.zobristKey, self.halfmoveClock, \
+            self.middlegame, self.endgame, self.phase = self.history.pop()
+        if color == BLACK:
+            self.fullmoveNumber -= 1
+
+        if flag & PROMOTION:
+            pawn = color * 6 + PAWN
+            bitboards[squares[end]] ^= 1 << end
+            bitboards[pawn] ^= 1 << end
+            squares[end] = pawn
+        elif flag == KING_CASTLE:
+            self.moveRook(color * 6 + ROOK, end - 1, end + 1)
+        elif flag == QUEEN_CASTLE:
+            self.moveRook(color * 6 + ROOK, end + 1, end - 2)
+
+        piece = squares[end]
+        startEnd = (1 << start) | (1 << end)
+        bitboards[piece] ^= startEnd
+        occupancy[color] ^= startEnd
+        squares[start] = piece
+        squares[end] = captured
+        if captured != -1:
+            bitboards[captured] ^= 1 << end
+            occupancy[color ^ 1] ^= 1 << end
+        elif flag == EP_CAPTURE:
+            passant = end + 8 if color == WHITE else end - 8
+            bitboards[(color ^ 1) * 6 + PAWN] ^= 1 << passant
+            occupancy[color ^ 1] ^= 1 << passant
+            squares[passant] = (color ^ 1) * 6 + PAWN
+
+    def moveRook(self, rook, start, end):
+        startEnd = (1 << start) | (1 << end)
+        self.bitboards[rook] ^= startEnd
+        self.occupancy[rook // 6] ^= startEnd
+        self.squares[start] = -1
+        self.squares[end] = rook
+
+    def isSquareAttacked(self, sq, color):
+        # True if any piece of color attacks sq
+        bitboards = self.bitboards
+        enemy = color * 6
+        if PAWN_ATTACKS[color ^ 1][sq] & bitboards[enemy + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bitboards[enemy + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & bitboards[enemy + KING]:
+            return True
+        occupied = self.occupancy[0] | self.occupancy[1]
+        queens = bitboards[enemy + QUEEN]
+        rooks = bitboards[enemy + ROOK] | queens
+        if rooks and rookAttacks(sq, occupied) & rooks:
+            return True
+        bishops = bitboards[enemy + BISHOP] | queens
+        if bishops and bishopAttacks(sq, occupied) & bishops:
+            return True
+        return False
+
+    def kingSquare(self, color):
+        return self.bitboards[color * 6 + KING].bit_length() - 1
+
+    def attackersTo(self, sq, color, occupied):
+        bitboards = self.bitboards
+        enemy = color * 6
+        queens = bitboards[enemy + QUEEN]
+        return (PAWN_ATTACKS[color ^ 1][sq] & bitboards[enemy + PAWN]) \
+            | (KNIGHT_ATTACKS[sq] & bitboards[enemy + KNIGHT]) \
+            | (KING_ATTACKS[sq] & bitboards[enemy + KING]) \
+            | (rookAttacks(sq, occupied) & (bitboards[enemy + ROOK] | queens)) \
+            | (bishopAttacks(sq, occupied) & (bitboards[enemy + BISHOP] | queens))
+
+    def attackedSquares(self, color, occupied):
+        # every square attacked by color
+        bitboards = self.bitboards
+        enemy = color * 6
+        pawns = bitboards[enemy + PAWN]
+        if color == WHITE:
+            attacked = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacked = (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL
+        for piece, table in ((KNIGHT, KNIGHT_ATTACKS), (KING, KING_ATTACKS)):
+            bb = bitboards[enemy + piece]
+            while bb:
+                lsb = bb & -bb
+                bb ^= lsb
+                attacked |= table[lsb.bit_length() - 1]
+        queens = bitboards[enemy + QUEEN]
+        for pieces, attacksOf in ((bitboards[enemy + ROOK] | queens, rookAttacks), (bitboards[enemy + BISHOP] | queens, bishopAttacks)):
+            while pieces:
+                lsb = pieces & -pieces
+                pieces ^= lsb
+                attacked |= attacksOf(lsb.bit_length() - 1, occupied)
+        return attacked
+
+    def getPinned(self, king, color, occupied):
+        # own pieces that are the only blocker between the king and an enemy slider
+        bitboards = self.bitboards
+        enemy = (color ^ 1) * 6
+        queens = bitboards[enemy + QUEEN]
+        pinners = (rookAttacks(king, 0) & (bitboards[enemy + ROOK] | queens)) \
+            | (bishopAttacks(king, 0) & (bitboards[enemy + BISHOP] | queens))
+        pinned = 0
+        own = self.occupancy[color]
+        while pinners:
+            lsb = pinners & -pinners
+            pinners ^= lsb
+            blockers = BETWEEN[king][lsb.bit_length() - 1] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+        return pinned
+
+    def getValidMoves(self):
+        moves = self.generateMoves(ALL_MOVES, self.getMoveContext())
+        self.result = self.getResult(moves)
+        self.gameOver = self.result != ONGOING
+        if self.gameOver:
+            self.notify('gameOver')
+        return moves
+
+    def getMoveContext(self):
+        # Checkers, pinned pieces and attacked squares are computed once and
+        # the move targets are masked with them, no move has to be tried out.
+        # The context stays valid for generateMoves until the position changes,
+        # so the kinds of moves can be generated one after the other.
+        color = WHITE if self.whiteToMove else BLACK
+        occupied = self.occupancy[0] | self.occupancy[1]
+        king = self.kingSquare(color)
+        checkers = self.attackersTo(king, color ^ 1, occupied)
+        self.inCheck = checkers != 0
+        # the king is removed so it can't step back along the ray of a slider
+        attacked = self.attackedSquares(color ^ 1, occupied ^ (1 << king))
+        if not checkers:
+            checkMask = FULL
+        elif not checkers & (checkers - 1):
+            checkMask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else:
+            # only the king can move out of a double check
+            checkMask = 0
+        pinned = self.getPinned(king, color, occupied) if checkMask else 0
+        return (color, king, checkers, attacked, pinned, checkMask)
+
+    def generateMoves(self, kinds, context):
+        # legal moves of the kinds NOISY_MOVES and QUIET_MOVES, context is the one of getMoveContext
+        color, king, checkers, attacked, pinned, checkMask = context
+        bitboards = self.bitboards
+        own = self.occupancy[color]
+        enemy = self.occupancy[color ^ 1]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        offset = color * 6
+        captureMask = enemy if kinds & NOISY_MOVES else 0
+        quietMask = empty if kinds & QUIET_MOVES else 0
+        # a pawn push is noisy when it promotes
+        lastRank = RANK_8 if color == WHITE else RANK_1
+        pushMask = (lastRank if kinds & NOISY_MOVES else 0) | (FULL ^ lastRank if kinds & QUIET_MOVES else 0)
+
+        moves = []
+        targets = KING_ATTACKS[king] & ~attacked
+        self.addMoves(moves, king, targets & captureMask, CAPTURE)
+        self.addMoves(moves, king, targets & quietMask, QUIET)
+        if not checkMask:
+            return moves
+        if not checkers and kinds & QUIET_MOVES:
+            self.addCastlingMoves(moves, color, occupied, attacked)
+
+        pawns = bitboards[offset + PAWN]
+        self.addPawnMoves(moves, color, pawns & ~pinned, enemy, empty, checkMask & pushMask, checkMask & captureMask)
+        pinnedPawns = pawns & pinned
+        while pinnedPawns:
+            lsb = pinnedPawns & -pinnedPawns
+            pinnedPawns ^= lsb
+            line = checkMask & LINE[king][lsb.bit_length() - 1]
+            self.addPawnMoves(moves, color, lsb, enemy, empty, line & pushMask, line & captureMask)
+        if self.enPassant != -1 and kinds & NOISY_MOVES:
+            self.addEnPassantMoves(moves, color, pawns, king)
+
+        for piece in (KNIGHT, BISHOP, ROOK, QUEEN):
+            bb = bitboards[offset + piece]
+            if piece == KNIGHT:
+                # a pinned knight can never move
+                bb &= ~pinned
+            while bb:
+                lsb = bb & -bb
+                start = lsb.bit_length() - 1
+                bb ^= lsb
+                if piece == KNIGHT:
+                    targets = KNIGHT_ATTACKS[start]
+                elif piece == BISHOP:
+                    targets = bishopAttacks(start, occupied)
+                elif piece == ROOK:
+                    targets = rookAttacks(start, occupied)
+                else:
+                    targets = rookAttacks(start, occupied) | bishopAttacks(start, occupied)
+                targets &= checkMask
+                if lsb & pinned:
+                    targets &= LINE[king][start]
+                self.addMoves(moves, start, targets & captureMask, CAPTURE)
+                self.addMoves(moves, start, targets & quietMask, QUIET)
+        return moves
+
+    def getResult(self, moves):
+        # moves are the legal moves of the position, getValidMoves sets inCheck
+        if len(moves) == 0:
+            return CHECKMATE if self.inCheck else STALEMATE
+        if self.halfmoveClock >= 100:
+            return FIFTY_MOVES
+        if self.getRepetitions() >= 2:
+            return REPETITION
+        if self.isInsufficientMaterial():
+            return INSUFFICIENT_MATERIAL
+        return ONGOING
+
+    def getRepetitions(self):
+        # how often the position occurred before, only the positions since
+        # the last capture or pawn move and with the same side to move can repeat
+        history = self.history
+        key = self.zobristKey
+        count = 0
+        for i in range(len(history) - 2, max(len(history) - self.halfmoveClock, 0) - 1, -2):
+            if history[i][3] == key:
+                count += 1
+        return count
+
+    def isInsufficientMaterial(self):
+        # kings alone, one knight or bishop, or only bishops all on squares of one color
+        bitboards = self.bitboards
+        if bitboards[PAWN] | bitboards[ROOK] | bitboards[QUEEN] | bitboards[6 + PAWN] | bitboards[6 + ROOK] | bitboards[6 + QUEEN]:
+            return False
+        knights = bitboards[KNIGHT] | bitboards[6 + KNIGHT]
+        bishops = bitboards[BISHOP] | bitboards[6 + BISHOP]
+        if (knights | bishops).bit_count() <= 1:
+            return True
+        return knights == 0 and (bishops & LIGHT_SQUARES == 0 or bishops & DARK_SQUARES == 0)
+
+    def getAllPlayerMoves(self):
+        moves = []
+        color = WHITE if self.whiteToMove else BLACK
+        bitboards = self.bitboards
+        own = self.occupancy[color]
+        enemy = self.occupancy[color ^ 1]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        offset = color * 6
+
+        self.addPawnMoves(moves, color, bitboards[offset + PAWN], enemy, empty, FULL, FULL)
+        if self.enPassant != -1:
+            self.addEnPassantMoves(moves, color, bitboards[offset + PAWN], None)
+
+        for piece, attacksOf in ((KNIGHT, None), (BISHOP, bishopAttacks), (ROOK, rookAttacks), (QUEEN, None), (KING, None)):
+            bb = bitboards[offset + piece]
+            while bb:
+                lsb = bb & -bb
+                start = lsb.bit_length() - 1
+                bb ^= lsb
+                if piece == KNIGHT:
+                    targets = KNIGHT_ATTACKS[start]
+                elif piece == KING:
+                    targets = KING_ATTACKS[start]
+                elif piece == QUEEN:
+                    targets = rookAttacks(start, occupied) | bishopAttacks(start, occupied)
+                else:
+                    targets = attacksOf(start, occupied)
+                targets &= ~own
+                self.addMoves(moves, start, targets & enemy, CAPTURE)
+                self.addMoves(moves, start, targets & empty, QUIET)
+
+        if not self.isSquareAttacked(self.kingSquare(color), color ^ 1):
+            self.addCastlingMoves(moves, color, occupied, self.attackedSquares(color ^ 1, occupied))
+        return moves
+
+    def addMoves(self, moves, start, targets, flag):
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            moves.append(start | ((lsb.bit_length() - 1) << 6) | (flag << 12))
+
+    def addPawnMoves(self, moves, color, pawns, enemy, empty, pushMask, captureMask):
+        # pushes end on pushMask and captures on captureMask
+        if color == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_3) >> 8) & empty & pushMask
+            left = ((pawns & ~FILE_A) >> 9) & enemy & captureMask
+            right = ((pawns & ~FILE_H) >> 7) & enemy & captureMask
+            forward, leftDelta, rightDelta, lastRank = 8, 9, 7, RANK_8
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_6) << 8) & empty & pushMask
+            left = ((pawns & ~FILE_A) << 7) & enemy & captureMask
+            right = ((pawns & ~FILE_H) << 9) & enemy & captureMask
+            forward, leftDelta, rightDelta, lastRank = -8, -7, -9, RANK_1
+        single &= pushMask
+
+        for targets, delta, flag in ((single, forward, QUIET), (left, leftDelta, CAPTURE), (right, rightDelta, CAPTURE)):
+            promotions = targets & lastRank
+            targets ^= promotions
+            while targets:
+                lsb = targets & -targets
+                targets ^= lsb
+                end = lsb.bit_length() - 1
+                moves.append((end + delta) | (end << 6) | (flag << 12))
+            while promotions:
+                lsb = promotions & -promotions
+                promotions ^= lsb
+                end = lsb.bit_length() - 1
+                for promotion in (3, 2, 1, 0):
+                    moves.append((end + delta) | (end << 6) | ((PROMOTION | flag | promotion) << 12))
+        while double:
+            lsb = double & -double
+            double ^= lsb
+            end = lsb.bit_length() - 1
+            moves.append((end + 2 * forward) | (end << 6) | (DOUBLE_PUSH << 12))
+
+    def addEnPassantMoves(self, moves, color, pawns, king):
+        # en passant removes two pieces from a rank, so with a king given the
+        # capture is tried out instead of masked
+        attackers = PAWN_ATTACKS[color ^ 1][self.enPassant] & pawns
+        while attackers:
+            lsb = attackers & -attackers
+            attackers ^= lsb
+            move = (lsb.bit_length() - 1) | (self.enPassant << 6) | (EP_CAPTURE << 12)
+            if king != None:
+                self.pushMove(move)
+                legal = not self.isSquareAttacked(king, color ^ 1)
+                self.popMove(move)
+                if not legal:
+                    continue
+            moves.append(move)
+
+    def addCastlingMoves(self, moves, color, occupied, attacked):
+        # the king must not be in check when this is called
+        if color == WHITE:
+            king, kingside, queenside = 60, WHITE_KINGSIDE, WHITE_QUEENSIDE
+        else:
+            king, kingside, queenside = 4, BLACK_KINGSIDE, BLACK_QUEENSIDE
+        if not self.castling & (kingside | queenside) or self.squares[king] != color * 6 + KING:
+            return
+        rook = color * 6 + ROOK
+        if self.castling & kingside and self.squares[king + 3] == rook \
+                and not occupied & (0b11 << (king + 1)) and not attacked & (0b11 << (king + 1)):
+            moves.append(king | ((king + 2) << 6) | (KING_CASTLE << 12))
+        if self.castling & queenside and self.squares[king - 4] == rook \
+                and not occupied & (0b111 << (king - 3)) and not attacked & (0b11 << (king - 2)):
+            moves.append(king | ((king - 2) << 6) | (QUEEN_CASTLE << 12))
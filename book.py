@@ -0,0 +1,142 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+import bitboard
+import pgn
+from pieces import getChessNotation
+
+# Opening books in the layout of Polyglot: 16 byte big endian entries of
+# key (uint64), move (uint16), weight (uint16) and learn (uint32), sorted by key.
+# The key is the Zobrist key of both backends and the move its packed integer,
+# so the books are not interchangeable with real Polyglot files.
+#
+# A book is memory mapped and searched in place, the operating system only reads
+# the pages the binary search touches.
+
+entryStruct = struct.Struct('>QHHI')
+ENTRY_SIZE = entryStruct.size
+
+class OpeningBook():
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file can't be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+        self.count = size // ENTRY_SIZE
+        self.random = random.Random()
+
+    def close(self):
+        if self.map != None:
+            self.map.close()
+        self.file.close()
+
+    def findFirst(self, key):
+        # index of the first entry whose key is not smaller than key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if entryStruct.unpack_from(self.map, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def getEntries(self, key):
+        # [(move, weight)] stored for the position with this Zobrist key
+        entries = []
+        if self.map == None:
+            return entries
+        for i in range(self.findFirst(key), self.count):
+            entryKey, move, weight, learn = entryStruct.unpack_from(self.map, i * ENTRY_SIZE)
+            if entryKey != key:
+                break
+            entries.append((move, weight))
+        return entries
+
+    def getMove(self, position, moves=None):
+        # A legal book move of the position picked at random by weight, None when
+        # the position is not in the book. Works with both backends.
+        entries = self.getEntries(position.zobristKey)
+        if len(entries) == 0:
+            return None
+        if moves == None:
+            moves = position.getValidMoves()
+        # a different position with the same key could have put moves here
+        entries = [(move, weight) for move, weight in entries if move in moves and weight > 0]
+        if len(entries) == 0:
+            return None
+        return self.random.choices([move for move, weight in entries], [weight for move, weight in entries])[0]
+
+def collectMoves(games, maxPlies, counts):
+    # adds the moves of the first maxPlies plies of every game to counts,
+    # {key: {move: weight}}, a win counts 2 for the side that made the move and a draw 1
+    for game in games:
+        if game.error != None or len(game.moves) == 0:
+            continue
+        position = bitboard.BitboardGameState(game.getStartFen())
+        for move in game.moves[:maxPlies]:
+            if game.result == '1/2-1/2' or game.result == '*':
+                score = 1
+            else:
+                score = 2 if (game.result == '1-0') == position.whiteToMove else 0
+            moves = counts.setdefault(position.zobristKey, {})
+            moves[move] = moves.get(move, 0) + score
+            position.pushMove(move)
+
+def writeBook(path, counts, minWeight=1):
+    entries = []
+    for key, moves in counts.items():
+        moves = {move: weight for move, weight in moves.items() if weight >= minWeight}
+        if len(moves) == 0:
+            continue
+        # the weights of a position keep their proportions within 16 bits
+        scale = max(1, -(-max(moves.values()) // 0xFFFF))
+        for move, weight in moves.items():
+            entries.append((key, -weight, move, max(1, weight // scale)))
+    # sorted by key, the most played move first
+    entries.sort()
+    with open(path, 'wb') as stream:
+        for key, order, move, weight in entries:
+            stream.write(entryStruct.pack(key, move, weight, 0))
+    return len(entries)
+
+def buildBook(pgnPath, bookPath, maxPlies=20, minWeight=1):
+    counts = {}
+    with open(pgnPath, encoding='utf-8', errors='replace') as stream:
+        collectMoves(pgn.readGames(stream), maxPlies, counts)
+    return writeBook(bookPath, counts, minWeight)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an opening book from a PGN file or look a position up')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build')
+    build.add_argument('pgn', help='games to read')
+    build.add_argument('book', help='file to write')
+    build.add_argument('--plies', type=int, default=20, help='plies of every game that go into the book')
+    build.add_argument('--min-weight', type=int, default=1, help='moves with a smaller weight are left out')
+    probe = subparsers.add_parser('probe')
+    probe.add_argument('book', help='file to read')
+    probe.add_argument('--fen', help='position to look up, the initial position when missing')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        entries = buildBook(args.pgn, args.book, args.plies, args.min_weight)
+        print('{} entries in {:.3f}s'.format(entries, time.perf_counter() - start))
+    else:
+        book = OpeningBook(args.book)
+        try:
+            position = bitboard.BitboardGameState(args.fen)
+            moves = position.getValidMoves()
+            for move, weight in book.getEntries(position.zobristKey):
+                if move in moves:
+                    print('{}  {}'.format(getChessNotation(move), weight))
+        finally:
+            book.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+import argparse
+import time
+import bitboard
+import evaluation
+import tablebase
+from bitboard import WHITE, BLACK, PAWN, CAPTURE, EP_CAPTURE, PROMOTION, NOISY_MOVES, QUIET_MOVES
+
+# Alpha-beta search with iterative deepening over the bitboard backend.
+# Scores are centipawns from the point of view of the side to move.
+
+INFINITY = 1000000
+MATE = 100000
+MAX_PLY = 64
+# scores past this are mates, the ones of the search within MAX_PLY plies and
+# the tablebase ones up to 255 plies of the table further
+MATE_BOUND = MATE - MAX_PLY - 255
+EXACT, LOWER, UPPER = 0, 1, 2
+# values for ordering captures, see evaluation.py for the ones of the evaluation
+pieceValues = [100, 320, 330, 500, 900, 0]
+# the king can only take last in an exchange
+exchangeValues = [100, 320, 330, 500, 900, 20000]
+
+class SearchAborted(Exception):
+    pass
+
+class TranspositionTable():
+    # Fixed number of slots indexed by the low bits of the Zobrist key.
+    # An entry is (key, depth, score, flag, move, age), a slot is replaced when
+    # it holds the same position, a shallower search or a search of an older move.
+
+    def __init__(self, size=1 << 20):
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.table = [None] * self.size
+        self.age = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.table = [None] * self.size
+        self.age = 0
+
+    def newSearch(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        entry = self.table[key & self.mask]
+        if entry != None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key & self.mask
+        entry = self.table[index]
+        if entry == None or entry[0] == key or depth >= entry[1] or entry[5] != self.age:
+            self.table[index] = (key, depth, score, flag, move, self.age)
+            self.stores += 1
+
+def scoreToTable(score, ply):
+    # mate scores are stored relative to the node, not to the root
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+def tablebaseScore(value, ply):
+    # a tablebase win or loss in dtm plies is a mate score like the ones of the search
+    wdl, dtm = value
+    if wdl == tablebase.WIN:
+        return MATE - ply - dtm
+    if wdl == tablebase.LOSS:
+        return -MATE + ply + dtm
+    return 0
+
+def getExchangeScore(position, move):
+    # Static exchange evaluation, the material the side to move wins with a
+    # capture when both sides go on taking on its square with their least
+    # valuable piece and may stop when that loses. Removing the pieces that
+    # took from the occupancy uncovers the sliders behind them.
+    end = (move >> 6) & 63
+    bitboards = position.bitboards
+    occupied = position.occupancy[0] | position.occupancy[1]
+    color = WHITE if position.whiteToMove else BLACK
+    if move >> 12 == EP_CAPTURE:
+        gains = [exchangeValues[PAWN]]
+        occupied ^= 1 << (end + 8 if color == WHITE else end - 8)
+    else:
+        gains = [exchangeValues[position.squares[end] % 6]]
+    attacker = position.squares[move & 63] % 6
+    occupied ^= 1 << (move & 63)
+    side = color ^ 1
+    while True:
+        attackers = position.attackersTo(end, side, occupied) & occupied
+        if not attackers:
+            break
+        for piece in range(6):
+            pieces = attackers & bitboards[side * 6 + piece]
+            if pieces:
+                break
+        # what the side taking now gains if the other side stops after it
+        gains.append(exchangeValues[attacker] - gains[-1])
+        attacker = piece
+        occupied ^= pieces & -pieces
+        side ^= 1
+    while len(gains) > 1:
+        gain = gains.pop()
+        gains[-1] = -max(-gains[-1], gain)
+    return gains[0]
+
+def getCaptureScore(position, move):
+    # MVV-LVA, the most valuable victim first and of those the least valuable attacker
+    flag = move >> 12
+    squares = position.squares
+    victim = PAWN if flag == EP_CAPTURE else squares[(move >> 6) & 63] % 6
+    return pieceValues[victim] * 10 - squares[move & 63] % 6
+
+def createSearchPosition(gs):
+    # The search plays its moves on a private bitboard position, so the game
+    # and whoever listens to it never see them. Both backends encode moves
+    # the same way, so the game's moves can be replayed as they are.
+    if isinstance(gs, bitboard.BitboardGameState):
+        return gs.copy()
+    position = bitboard.BitboardGameState(gs.startFen)
+    for move in gs.moveLog:
+        position.makeMove(move)
+    return position
+
+class Engine():
+
+    def __init__(self, ttSize=1 << 20):
+        self.tt = TranspositionTable(ttSize)
+        self.pawnHash = evaluation.PawnHashTable()
+        self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        self.history = [[0] * 64 for piece in range(12)]
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.rootMove = None
+        # callback(info) called after every finished depth
+        self.info = None
+        # one dict per finished depth of the last search
+        self.searchInfo = []
+        # book.OpeningBook, its moves are played without searching while the game is in it
+        self.book = None
+        # tablebase.Tablebase, positions in it are scored without searching them
+        self.tablebase = None
+
+    def stop(self):
+        self.stopped = True
+
+    def newGame(self):
+        # forgets what earlier games taught the move ordering and the table
+        self.tt.clear()
+        self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        self.history = [[0] * 64 for piece in range(12)]
+
+    def bestMove(self, gs, depth=None, movetime=None):
+        # Searches until depth is reached or movetime seconds passed and
+        # returns the best move, None without legal moves
+        return self.search(createSearchPosition(gs), depth, movetime)
+
+    def search(self, position, maxDepth=None, movetime=None):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = start + movetime if movetime != None else None
+        self.searchInfo = []
+        self.tt.newSearch()
+        self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        for counters in self.history:
+            for sq in range(64):
+                counters[sq] >>= 1
+
+        moves = position.getValidMoves()
+        if len(moves) == 0:
+            return None
+        if self.book != None:
+            move = self.book.getMove(position, moves)
+            if move != None:
+                return move
+        bestMove = moves[0]
+        if maxDepth == None:
+            maxDepth = MAX_PLY if movetime != None else 4
+        for depth in range(1, min(maxDepth, MAX_PLY) + 1):
+            self.rootMove = None
+            try:
+                score = self.negamax(position, depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                # the position is left in the middle of the aborted line
+                break
+            bestMove = self.rootMove
+            seconds = time.perf_counter() - start
+            info = {'depth': depth, 'score': score, 'nodes': self.nodes, 'seconds': seconds,
+                    'nps': int(self.nodes / seconds) if seconds > 0 else 0,
+                    'pv': self.getPrincipalVariation(position, depth)}
+            self.searchInfo.append(info)
+            if self.info != None:
+                self.info(info)
+            if abs(score) >= MATE_BOUND:
+                break
+        return bestMove
+
+    def searchMove(self, position, move, depth, alpha, beta, movetime=None):
+        # Score of a single root move, the root of a search can be split this way
+        # between processes. Returns None when the time ran out.
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = time.perf_counter() + movetime if movetime != None else None
+        position.pushMove(move)
+        try:
+            score = -self.negamax(position, depth - 1, -beta, -alpha, 1)
+        except SearchAborted:
+            return None
+        position.popMove(move)
+        return score
+
+    def checkTime(self):
+        if self.stopped or (self.deadline != None and time.perf_counter() >= self.deadline):
+            self.stopped = True
+            raise SearchAborted()
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkTime()
+        # Inside the search a single repetition is already a draw, the side
+        # that is better off will avoid it anyway. The table doesn't know
+        # the moves that led to a position, so this comes before probing it.
+        if ply > 0 and (position.halfmoveClock >= 100 or position.getRepetitions() > 0 or position.isInsufficientMaterial()):
+            return 0
+        if self.tablebase != None and ply > 0 and (position.occupancy[0] | position.occupancy[1]).bit_count() <= self.tablebase.maxPieces:
+            value = self.tablebase.probe(position)
+            if value != None:
+                return tablebaseScore(value, ply)
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(position, alpha, beta, ply)
+
+        key = position.zobristKey
+        ttMove = None
+        entry = self.tt.probe(key)
+        if entry != None:
+            ttMove = entry[4]
+            if entry[1] >= depth and ply > 0:
+                score = scoreFromTable(entry[2], ply)
+                if entry[3] == EXACT:
+                    return score
+                if entry[3] == LOWER and score >= beta:
+                    return score
+                if entry[3] == UPPER and score <= alpha:
+                    return score
+
+        alphaStart = alpha
+        bestScore = -INFINITY
+        bestMove = None
+        moveCount = 0
+        for move in self.getStagedMoves(position, ttMove, ply):
+            moveCount += 1
+            position.pushMove(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.popMove(move)
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if ply == 0:
+                    self.rootMove = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not (move >> 12) & (CAPTURE | PROMOTION):
+                            self.updateQuietMove(position, move, depth, ply)
+                        break
+        if moveCount == 0:
+            # no move was searched, so inCheck is still the one of this position
+            return -MATE + ply if position.inCheck else 0
+
+        if bestScore <= alphaStart:
+            flag = UPPER
+        elif bestScore >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, scoreToTable(bestScore, ply), flag, bestMove)
+        return bestScore
+
+    def quiescence(self, position, alpha, beta, ply):
+        # only captures and promotions are searched until the position is quiet
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkTime()
+        standPat = evaluation.evaluate(position, self.pawnHash)
+        if standPat >= beta or ply >= MAX_PLY:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        for move in self.getCaptureMoves(position):
+            position.pushMove(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.popMove(move)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def getStagedMoves(self, position, ttMove, ply):
+        # Yields the legal moves in stages and generates a stage only when the
+        # search gets to it, most nodes are cut off by one of the first moves:
+        # hash move, captures that don't lose material by MVV-LVA, promotions,
+        # killers, quiet moves by history and last the captures that lose material.
+        # The table stores whole keys, so a hash move is a legal move of the position.
+        squares = position.squares
+        if ttMove != None and squares[ttMove & 63] // 6 == (0 if position.whiteToMove else 1):
+            yield ttMove
+        else:
+            ttMove = None
+        context = position.getMoveContext()
+
+        captures = []
+        promotions = []
+        losingCaptures = []
+        for move in position.generateMoves(NOISY_MOVES, context):
+            if move == ttMove:
+                continue
+            flag = move >> 12
+            if flag & CAPTURE:
+                # taking a piece worth at least the attacker can't lose material
+                victim = PAWN if flag == EP_CAPTURE else squares[(move >> 6) & 63] % 6
+                if pieceValues[victim] < pieceValues[squares[move & 63] % 6] and getExchangeScore(position, move) < 0:
+                    losingCaptures.append((getCaptureScore(position, move), move))
+                else:
+                    captures.append((getCaptureScore(position, move), move))
+            else:
+                promotions.append((flag & 3, move))
+        captures.sort(reverse=True)
+        for score, move in captures:
+            yield move
+        promotions.sort(reverse=True)
+        for score, move in promotions:
+            yield move
+
+        quiets = position.generateMoves(QUIET_MOVES, context)
+        killers = [killer for killer in self.killers[ply] if killer != None and killer != ttMove and killer in quiets]
+        for move in killers:
+            yield move
+        history = self.history
+        scored = [(history[squares[move & 63]][(move >> 6) & 63], move) for move in quiets if move != ttMove and move not in killers]
+        scored.sort(reverse=True)
+        for score, move in scored:
+            yield move
+
+        losingCaptures.sort(reverse=True)
+        for score, move in losingCaptures:
+            yield move
+
+    def getCaptureMoves(self, position):
+        # captures and promotions for the quiescence search by MVV-LVA, without
+        # the captures that lose material
+        squares = position.squares
+        captures = []
+        for move in position.generateMoves(NOISY_MOVES, position.getMoveContext()):
+            flag = move >> 12
+            if flag & CAPTURE:
+                victim = PAWN if flag == EP_CAPTURE else squares[(move >> 6) & 63] % 6
+                if pieceValues[victim] < pieceValues[squares[move & 63] % 6] and getExchangeScore(position, move) < 0:
+                    continue
+                captures.append((getCaptureScore(position, move), move))
+            else:
+                # promotions come after the captures, a queen first
+                captures.append(((flag & 3) - 10, move))
+        captures.sort(reverse=True)
+        return [move for score, move in captures]
+
+    def orderMoves(self, position, moves, ttMove, ply):
+        # hash move, captures by MVV-LVA, promotions, killers, then quiet moves by history
+        squares = position.squares
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            flag = move >> 12
+            start = move & 63
+            end = (move >> 6) & 63
+            if move == ttMove:
+                score = 10000000
+            elif flag & CAPTURE:
+                victim = PAWN if flag == EP_CAPTURE else squares[end] % 6
+                score = 1000000 + pieceValues[victim] * 10 - squares[start] % 6
+            elif flag & PROMOTION:
+                score = 900000 + (flag & 3)
+            elif move == killers[0] or move == killers[1]:
+                score = 800000
+            else:
+                score = history[squares[start]][end]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for score, move in scored]
+
+    def updateQuietMove(self, position, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        piece = position.squares[move & 63]
+        self.history[piece][(move >> 6) & 63] += depth * depth
+
+    def getPrincipalVariation(self, position, depth):
+        pv = []
+        for i in range(depth):
+            entry = self.tt.probe(position.zobristKey)
+            if entry == None or entry[4] == None or entry[4] not in position.getValidMoves():
+                break
+            pv.append(entry[4])
+            position.pushMove(entry[4])
+        for move in reversed(pv):
+            position.popMove(move)
+        return pv
+
+def printInfo(info):
+    pv = ' '.join(bitboard.getChessNotation(move) for move in info['pv'])
+    print('depth {:>2}  score {:>7}  nodes {:>9}  time {:>7.3f}s  nps {:>7}  pv {}'.format(
+        info['depth'], info['score'], info['nodes'], info['seconds'], info['nps'], pv))
+
+def main():
+    parser = argparse.ArgumentParser(description='Search a position and print the best move')
+    parser.add_argument('--fen', help='position to search, the initial position when missing')
+    parser.add_argument('--depth', type=int)
+    parser.add_argument('--movetime', type=float, help='seconds to search')
+    parser.add_argument('--book', help='opening book to play from, see book.py')
+    parser.add_argument('--tablebases', help='directory of endgame tables, see tablebase.py')
+    args = parser.parse_args()
+    engine = Engine()
+    engine.info = printInfo
+    if args.book != None:
+        import book
+        engine.book = book.OpeningBook(args.book)
+    if args.tablebases != None:
+        engine.tablebase = tablebase.Tablebase(args.tablebases)
+    move = engine.bestMove(bitboard.BitboardGameState(args.fen), args.depth, args.movetime)
+    print('bestmove', bitboard.getChessNotation(move) if move != None else '(none)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+from bitboard import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, FILE_A, FULL, KNIGHT_ATTACKS
+from bitboard import BitboardGameState, pieceIndex, rookAttacks, bishopAttacks
+from pieces import knightTargets, bishopRays, rookRays, queenRays
+from psqt import maxPhase
+
+# Static evaluation in centipawns from the side to move, of a BitboardGameState
+# or a game.GameState. Material and piece-square scores are the sums both
+# backends keep up to date with every move, so they cost nothing here.
+# Mobility is counted over the pieces, the pawn structure only changes with
+# pawn moves and is looked up in a PawnHashTable by the pawns of both sides.
+# Every term has a middlegame and an endgame part, they are blended by the
+# phase of the position.
+
+# score per square a piece attacks that isn't taken by its own pieces, (middlegame, endgame)
+mobilityWeights = {KNIGHT: (4, 4), BISHOP: (5, 5), ROOK: (2, 4), QUEEN: (1, 2)}
+doubledPenalty = (10, 20)
+isolatedPenalty = (10, 15)
+# bonus of a passed pawn by the number of ranks it went forward
+passedBonus = [(0, 0), (5, 10), (10, 20), (20, 40), (35, 70), (60, 120), (0, 0)]
+
+boardRays = {BISHOP: bishopRays, ROOK: rookRays, QUEEN: queenRays}
+
+FILES = [FILE_A << col for col in range(8)]
+ADJACENT_FILES = [(FILES[col - 1] if col > 0 else 0) | (FILES[col + 1] if col < 7 else 0) for col in range(8)]
+
+def createPassedMasks():
+    # squares in front of a pawn on its file and the files next to it, a pawn
+    # is passed when no enemy pawn stands on them
+    masks = [[0] * 64, [0] * 64]
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        files = FILES[col] | ADJACENT_FILES[col]
+        masks[WHITE][sq] = files & ((1 << (row * 8)) - 1)
+        masks[BLACK][sq] = files & (FULL ^ ((1 << ((row + 1) * 8)) - 1))
+    return masks
+
+PASSED_MASKS = createPassedMasks()
+
+class PawnHashTable():
+    # Pawn structure scores by the pawns of both sides. Slots are indexed by
+    # the hash of the two pawn bitboards and hold them to check the entry.
+
+    def __init__(self, size=1 << 14):
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.table = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.table = [None] * self.size
+
+    def getScores(self, whitePawns, blackPawns):
+        index = hash((whitePawns, blackPawns)) & self.mask
+        entry = self.table[index]
+        if entry != None and entry[0] == whitePawns and entry[1] == blackPawns:
+            self.hits += 1
+            return entry[2], entry[3]
+        self.misses += 1
+        middlegame, endgame = evaluatePawns(whitePawns, blackPawns)
+        self.table[index] = (whitePawns, blackPawns, middlegame, endgame)
+        return middlegame, endgame
+
+def evaluatePawns(whitePawns, blackPawns):
+    # (middlegame, endgame) of doubled, isolated and passed pawns, positive for white
+    middlegame = 0
+    endgame = 0
+    for color, pawns, enemyPawns in ((WHITE, whitePawns, blackPawns), (BLACK, blackPawns, whitePawns)):
+        sign = 1 if color == WHITE else -1
+        bb = pawns
+        while bb:
+            lsb = bb & -bb
+            bb ^= lsb
+            sq = lsb.bit_length() - 1
+            row, col = divmod(sq, 8)
+            if pawns & FILES[col] & ~lsb:
+                middlegame -= sign * doubledPenalty[0]
+                endgame -= sign * doubledPenalty[1]
+            if not pawns & ADJACENT_FILES[col]:
+                middlegame -= sign * isolatedPenalty[0]
+                endgame -= sign * isolatedPenalty[1]
+            if not enemyPawns & PASSED_MASKS[color][sq]:
+                bonus = passedBonus[6 - row if color == WHITE else row - 1]
+                middlegame += sign * bonus[0]
+                endgame += sign * bonus[1]
+    return middlegame, endgame
+
+def evaluateMobility(position):
+    # (middlegame, endgame) of the squares the pieces attack, positive for white
+    bitboards = position.bitboards
+    occupied = position.occupancy[0] | position.occupancy[1]
+    middlegame = 0
+    endgame = 0
+    for color in (WHITE, BLACK):
+        sign = 1 if color == WHITE else -1
+        free = FULL ^ position.occupancy[color]
+        for piece, weights in mobilityWeights.items():
+            bb = bitboards[color * 6 + piece]
+            while bb:
+                lsb = bb & -bb
+                bb ^= lsb
+                sq = lsb.bit_length() - 1
+                if piece == KNIGHT:
+                    attacks = KNIGHT_ATTACKS[sq]
+                elif piece == BISHOP:
+                    attacks = bishopAttacks(sq, occupied)
+                elif piece == ROOK:
+                    attacks = rookAttacks(sq, occupied)
+                else:
+                    attacks = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                count = (attacks & free).bit_count()
+                middlegame += sign * weights[0] * count
+                endgame += sign * weights[1] * count
+    return middlegame, endgame
+
+def evaluateBoardMobility(gs):
+    # evaluateMobility for a game.GameState, over its board with the tables of pieces.py
+    board = gs.board
+    middlegame = 0
+    endgame = 0
+    for sq in range(64):
+        piece = board[sq >> 3][sq & 7].piece
+        if piece == None:
+            continue
+        kind = pieceIndex[str(piece)] % 6
+        weights = mobilityWeights.get(kind)
+        if weights == None:
+            continue
+        rays = [knightTargets[sq]] if kind == KNIGHT else boardRays[kind][sq]
+        count = 0
+        for ray in rays:
+            for target in ray:
+                other = board[target >> 3][target & 7].piece
+                if other == None:
+                    count += 1
+                    continue
+                if other.playerColor != piece.playerColor:
+                    count += 1
+                # a knight jumps over the pieces
+                if kind != KNIGHT:
+                    break
+        sign = 1 if piece.playerColor == 'w' else -1
+        middlegame += sign * weights[0] * count
+        endgame += sign * weights[1] * count
+    return middlegame, endgame
+
+def getBoardPawns(gs):
+    # pawn bitboards of white and black of a game.GameState
+    pawns = [0, 0]
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c].piece
+            if piece != None and str(piece)[1] == 'p':
+                pawns[0 if piece.playerColor == 'w' else 1] |= 1 << (r * 8 + c)
+    return pawns
+
+def evaluate(position, pawnHash=None):
+    middlegame = position.middlegame
+    endgame = position.endgame
+    if isinstance(position, BitboardGameState):
+        whitePawns = position.bitboards[PAWN]
+        blackPawns = position.bitboards[6 + PAWN]
+        mobilityMiddlegame, mobilityEndgame = evaluateMobility(position)
+    else:
+        whitePawns, blackPawns = getBoardPawns(position)
+        mobilityMiddlegame, mobilityEndgame = evaluateBoardMobility(position)
+    if pawnHash != None:
+        pawnMiddlegame, pawnEndgame = pawnHash.getScores(whitePawns, blackPawns)
+    else:
+        pawnMiddlegame, pawnEndgame = evaluatePawns(whitePawns, blackPawns)
+    middlegame += pawnMiddlegame + mobilityMiddlegame
+    endgame += pawnEndgame + mobilityEndgame
+    # promotions can push the phase over the one of the initial position
+    phase = min(position.phase, maxPhase)
+    score = (middlegame * phase + endgame * (maxPhase - phase)) // maxPhase
+    return score if position.whiteToMove else -score
@@ -0,0 +1,91 @@
+import argparse
+import time
+import numpy as np
+import bitboard
+
+# Input planes for evaluation models. Positions are encoded from the tuples of
+# packPosition, both backends produce them, into (N, 8, 8, CHANNELS) arrays
+# with one bit per square and plane, indexed [position, row, col, plane]:
+#   0-11   pieces in the order of bitboard.pieceNames, wp wN wB wR wQ wK bp ... bK
+#   12     side to move, all ones when white is to move
+#   13-16  castling rights K Q k q
+#   17     en passant square
+CHANNELS = 18
+PIECE_PLANES = 12
+SIDE_PLANE = 12
+CASTLING_PLANE = 13
+EN_PASSANT_PLANE = 17
+
+castlingBits = np.array([1, 2, 4, 8], dtype=np.uint8)
+
+def createBuffer(size, dtype=np.uint8):
+    return np.zeros((size, 8, 8, CHANNELS), dtype=dtype)
+
+def encodePositions(positions, out=None):
+    # Fills out, or a new uint8 array, with the planes of every packed position
+    # and returns the part of it that was written
+    n = len(positions)
+    if out is None:
+        out = createBuffer(n)
+    out = out[:n]
+    if n == 0:
+        return out
+    bitboards, whiteToMove, castling, enPassant = zip(*positions)
+
+    # bit n of a bitboard is square n = row * 8 + col, so the little endian bytes
+    # of a bitboard are the rows of the board and their bits the columns
+    bits = np.unpackbits(np.array(bitboards, dtype='<u8').view(np.uint8), bitorder='little')
+    out[..., :PIECE_PLANES] = bits.reshape(n, PIECE_PLANES, 8, 8).transpose(0, 2, 3, 1)
+    out[..., SIDE_PLANE] = np.array(whiteToMove, dtype=np.uint8)[:, None, None]
+    rights = (np.array(castling, dtype=np.uint8)[:, None] & castlingBits) != 0
+    out[..., CASTLING_PLANE:EN_PASSANT_PLANE] = rights[:, None, None, :]
+    out[..., EN_PASSANT_PLANE] = 0
+    enPassant = np.array(enPassant)
+    withPassant = np.nonzero(enPassant != -1)[0]
+    out[withPassant, enPassant[withPassant] // 8, enPassant[withPassant] % 8, EN_PASSANT_PLANE] = 1
+    return out
+
+def iteratePositions(games):
+    # packed positions before every move and after the last one of each game,
+    # games are pgn.Game objects such as the ones of pgn.readGames
+    for game in games:
+        try:
+            position = bitboard.BitboardGameState(game.getStartFen())
+        except ValueError:
+            # a game with an invalid FEN has no positions
+            continue
+        yield position.packPosition()
+        for move in game.moves:
+            position.pushMove(move)
+            yield position.packPosition()
+
+def streamBatches(positions, batchSize, dtype=np.uint8):
+    # Encodes an iterable of packed positions in batches of batchSize. Every batch
+    # is written into the same buffer, a batch has to be used or copied before the
+    # next one is requested. The last batch can be smaller.
+    out = createBuffer(batchSize, dtype)
+    batch = []
+    for packed in positions:
+        batch.append(packed)
+        if len(batch) == batchSize:
+            yield encodePositions(batch, out)
+            batch = []
+    if len(batch) > 0:
+        yield encodePositions(batch, out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Encode the positions of a PGN file and report the speed')
+    parser.add_argument('pgn', help='file to read')
+    parser.add_argument('--batch', type=int, default=4096, help='positions per batch')
+    args = parser.parse_args()
+    import pgn
+    start = time.perf_counter()
+    positions = 0
+    with open(args.pgn, encoding='utf-8', errors='replace') as stream:
+        for batch in streamBatches(iteratePositions(pgn.readGames(stream)), args.batch):
+            positions += len(batch)
+    seconds = time.perf_counter() - start
+    print('{} positions in {:.3f}s, {:.0f} positions/s'.format(positions, seconds, positions / max(seconds, 1e-9)))
+
+if __name__ == '__main__':
+    main()
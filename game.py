@@ -1,89 +1,525 @@
-import numpy as np
-from pieces import Square, Pawn, Rook, Knight, Bishop, Queen, King
-import datetime
+from pieces import Square, Pawn, Rook, Knight, Bishop, Queen, King, ranksToRows, filesToCols, promotionNames, getChessNotation, createFen
+from pieces import queenDirections, queenRays
+from pieces import DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, EP_CAPTURE, PROMOTION
+from pieces import ONGOING, CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT_MATERIAL
+import zobrist
+import psqt
+from collections import OrderedDict
+
+initialFen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+class MoveCache():
+    # Legal moves of the most recently used positions, keyed by Zobrist key.
+    # The key covers the side to move, the castling rights and a capturable
+    # en passant square, the only state besides the pieces the moves depend on.
+    # An entry is (moves, inCheck), a capacity of 0 disables the cache.
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        entry = self.entries.get(key)
+        if entry == None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key, moves, inCheck):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = (moves, inCheck)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
 class GameState():
 
-    def __init__(self):
-        # board is an 8x8 2d list, each element of the list has 2 characters.
-        #The first character represents the color of the piece, 'b' or 'w'
-        #The second character represents the type of the piece, 'K', 'Q', 'R', 'B', 'N' or 'P'
-        #"--" represent and empty space with no piece
-        self.board = [
-            [Square('bR'), Square('bN'), Square('bB'), Square('bQ'), Square('bK'), Square('bB'), Square('bN'), Square('bR')],
-            [Square('bp'), Square('bp'), Square('bp'), Square('bp'), Square('bp'), Square('bp'), Square('bp'), Square('bp')],
-            [Square(), Square(), Square(), Square(), Square(), Square(), Square(), Square()],
-            [Square(), Square(), Square(), Square(), Square(), Square(), Square(), Square()],
-            [Square(),      Square(),       Square(),       Square(),       Square(),       Square(),       Square(),       Square()],
-            [Square(),      Square(),       Square(),       Square(),       Square(),       Square(),       Square(),       Square()],
-            [Square('wp'), Square('wp'), Square('wp'), Square('wp'), Square('wp'), Square('wp'), Square('wp'), Square('wp')],
-            [Square('wR'), Square('wN'), Square('wB'), Square('wQ'), Square('wK'), Square('wB'), Square('wN'), Square('wR')],
-        ]
+    def __init__(self, fen=None, moveCacheSize=4096):
+        # board is an 8x8 2d list of Squares, row 0 is the 8th rank. A Square holds
+        # a piece whose name has 2 characters, the color 'w' or 'b' and the type
+        # 'K', 'Q', 'R', 'B', 'N' or 'p'
+        self.inCheck = False
+        self.gameOver = False
+        self.result = ONGOING
+        self.listeners = []
+        self.moveCache = MoveCache(moveCacheSize)
+        self.loadFen(fen if fen != None else initialFen)
+
+    def loadFen(self, fen):
+        self.startFen = fen
+        fields = fen.split()
+        self.board = [[Square() for c in range(8)] for r in range(8)]
+        for r, row in enumerate(fields[0].split('/')):
+            c = 0
+            for char in row:
+                if char.isdigit():
+                    c += int(char)
+                    continue
+                color = 'w' if char.isupper() else 'b'
+                name = 'p' if char in 'pP' else char.upper()
+                self.board[r][c] = Square(color + name)
+                c += 1
+        self.whiteToMove = fields[1] == 'w'
+        # a lost castling right is stored as a rook that already moved
+        castling = fields[2] if len(fields) > 2 else '-'
+        for right, r, c in (('K', 7, 7), ('Q', 7, 0), ('k', 0, 7), ('q', 0, 0)):
+            rook = self.board[r][c].piece
+            if right not in castling and isinstance(rook, Rook):
+                rook.rookMovements.append(None)
+        # en passant square of the position the game started from
+        passant = fields[3] if len(fields) > 3 else '-'
+        if passant != '-':
+            self.enPassantSquare = (ranksToRows[passant[1]], filesToCols[passant[0]])
+        else:
+            self.enPassantSquare = None
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
         self.moveLog = []
-        self.whiteToMove = True
+        # Zobrist key of the position, updated by makeMove and restored by undoMove
+        self.zobristKey = self.computeHash()
+        self.computeScores()
+        # (piece moved, piece captured, zobrist key, halfmove clock, middlegame, endgame, phase)
+        # before every move of moveLog
+        self.undoLog = []
+        self.kingSquares = {}
+        for color in ('w', 'b'):
+            kingRow, kingCol = self.findKing(color)
+            self.kingSquares[color] = kingRow*8 + kingCol
+        self.computeAttacks()
+
+    def getFen(self):
+        names = [str(square.piece) if square.piece != None else None for row in self.board for square in row]
+        passantSquare = self.getEnPassantSquare()
+        enPassant = passantSquare[0]*8 + passantSquare[1] if passantSquare != None else -1
+        return createFen(names, self.whiteToMove, self.getCastlingRights(), enPassant, self.halfmoveClock, self.fullmoveNumber)
+
+    def subscribe(self, listener):
+        # listener(event, *args) is called after every change of the position
+        self.listeners.append(listener)
+
+    def notify(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
 
     def getLastMove(self):
         if len(self.moveLog) != 0:
             return self.moveLog[-1]
         return None
 
-    def encode_board(self, board):
-        encoded = np.zeros([8, 8, 22]).astype(int)
-        encoder_dict = {"bR":0, "bN":1, "bB":2, "bQ":3, "bK":4, "bp":5, "wR":7, "wN":8, "wB":9, "wQ":10, "wK":11, "wp":12}
-        for i in range(8):
-            for j in range(8):
-                if board[i][j] != None:
-                    encoded[i,j,encoder_dict[board[i][j]]] = 1
-        encoded[:,:,12] = 1
-        return encoded
+    def getEnPassantSquare(self):
+        lastMove = self.getLastMove()
+        if lastMove == None:
+            return self.enPassantSquare
+        if lastMove >> 12 == DOUBLE_PUSH:
+            return ((((lastMove & 63) + ((lastMove >> 6) & 63)) // 2) >> 3, lastMove & 7)
+        return None
+
+    def getCastlingRights(self):
+        # K = 1, Q = 2, k = 4, q = 8 while the king and the rook never moved
+        rights = 0
+        for flag, r, c in ((1, 7, 7), (2, 7, 0), (4, 0, 7), (8, 0, 0)):
+            color = 'w' if r == 7 else 'b'
+            king = self.board[r][4].piece
+            rook = self.board[r][c].piece
+            if isinstance(king, King) and king.playerColor == color and not king.hasKingMove() \
+                    and isinstance(rook, Rook) and rook.playerColor == color and not rook.hasRookMove():
+                rights |= flag
+        return rights
+
+    def getEnPassantCol(self):
+        # the en passant square only changes the position if a pawn can capture on it
+        passantSquare = self.getEnPassantSquare()
+        if passantSquare == None:
+            return None
+        r, c = passantSquare
+        pawnRow = r + 1 if self.whiteToMove else r - 1
+        playerColor = 'w' if self.whiteToMove else 'b'
+        for col in (c - 1, c + 1):
+            if 0 <= col <= 7:
+                piece = self.board[pawnRow][col].piece
+                if isinstance(piece, Pawn) and piece.playerColor == playerColor:
+                    return c
+        return None
+
+    def getStateKey(self):
+        key = zobrist.castlingKeys[self.getCastlingRights()]
+        col = self.getEnPassantCol()
+        if col != None:
+            key ^= zobrist.enPassantKeys[col]
+        return key
+
+    def computeHash(self):
+        key = self.getStateKey()
+        if not self.whiteToMove:
+            key ^= zobrist.sideKey
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                piece = self.board[r][c].piece
+                if piece != None:
+                    key ^= zobrist.pieceKeys[str(piece)][r*8 + c]
+        return key
+
+    def getMoveKey(self, move):
+        # pieces that leave or enter a square with this move, called before the move is made
+        pieceKeys = zobrist.pieceKeys
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        moved = str(self.board[start >> 3][start & 7].piece)
+        key = pieceKeys[moved][start] ^ pieceKeys[moved][end]
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            rook = moved[0] + 'R'
+            rookStart, rookEnd = (start + 3, start + 1) if flag == KING_CASTLE else (start - 4, start - 1)
+            return key ^ pieceKeys[rook][rookStart] ^ pieceKeys[rook][rookEnd]
+        if flag == EP_CAPTURE:
+            captureSq = (start & ~7) | (end & 7)
+            key ^= pieceKeys[str(self.board[captureSq >> 3][captureSq & 7].piece)][captureSq]
+        elif self.board[end >> 3][end & 7].piece != None:
+            key ^= pieceKeys[str(self.board[end >> 3][end & 7].piece)][end]
+        if flag & PROMOTION:
+            key ^= pieceKeys[moved][end] ^ pieceKeys[moved[0] + promotionNames[flag & 3]][end]
+        return key
+
+    def computeScores(self):
+        # sums of the piece-square scores and the phase, the same as the ones of
+        # BitboardGameState, see psqt.py
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                piece = self.board[r][c].piece
+                if piece != None:
+                    name = str(piece)
+                    self.middlegame += psqt.middlegameScores[name][r*8 + c]
+                    self.endgame += psqt.endgameScores[name][r*8 + c]
+                    self.phase += psqt.phaseWeights[name[1]]
+
+    def getMoveScores(self, move):
+        # changes of the sums with this move, called before the move is made like getMoveKey
+        middlegameScores = psqt.middlegameScores
+        endgameScores = psqt.endgameScores
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        moved = str(self.board[start >> 3][start & 7].piece)
+        placed = moved[0] + promotionNames[flag & 3] if flag & PROMOTION else moved
+        middlegame = middlegameScores[placed][end] - middlegameScores[moved][start]
+        endgame = endgameScores[placed][end] - endgameScores[moved][start]
+        phase = psqt.phaseWeights[placed[1]] - psqt.phaseWeights[moved[1]]
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            rook = moved[0] + 'R'
+            rookStart, rookEnd = (start + 3, start + 1) if flag == KING_CASTLE else (start - 4, start - 1)
+            middlegame += middlegameScores[rook][rookEnd] - middlegameScores[rook][rookStart]
+            endgame += endgameScores[rook][rookEnd] - endgameScores[rook][rookStart]
+            return middlegame, endgame, phase
+        captureSq = (start & ~7) | (end & 7) if flag == EP_CAPTURE else end
+        captured = self.board[captureSq >> 3][captureSq & 7].piece
+        if captured != None:
+            name = str(captured)
+            middlegame -= middlegameScores[name][captureSq]
+            endgame -= endgameScores[name][captureSq]
+            phase -= psqt.phaseWeights[name[1]]
+        return middlegame, endgame, phase
+
+    def packPosition(self):
+        # the same tuple as BitboardGameState.packPosition
+        bitboards = [0] * 12
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                piece = self.board[r][c].piece
+                if piece != None:
+                    bitboards[zobrist.pieceNames.index(str(piece))] |= 1 << (r*8 + c)
+        passantSquare = self.getEnPassantSquare()
+        enPassant = passantSquare[0]*8 + passantSquare[1] if passantSquare != None else -1
+        return (tuple(bitboards), self.whiteToMove, self.getCastlingRights(), enPassant)
+
+    def encode_board(self):
+        # (8, 8, features.CHANNELS) planes of the position, see features.encodePositions for many at once
+        # imported here, the rules don't need numpy
+        import features
+        return features.encodePositions([self.packPosition()])[0]
     
-    def makeMove(self, move, gameController):
-        move.pieceMoved.makeMove(move, self.board, gameController)
+    def computeAttacks(self):
+        # attackMap holds the squares attacked by the piece on every occupied square
+        # and attackCounts how many pieces of each color attack every square
+        self.attackMap = {}
+        self.attackCounts = {'w': [0] * 64, 'b': [0] * 64}
+        self.addAttacks(range(64))
+
+    def isAttacked(self, square, color):
+        # True if a piece of color attacks the square
+        return self.attackCounts[color][square] > 0
+
+    def getChangedSquares(self, move):
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        if flag == EP_CAPTURE:
+            return {start, end, (start & ~7) | (end & 7)}
+        if flag == KING_CASTLE:
+            return {start, end, start + 3, start + 1}
+        if flag == QUEEN_CASTLE:
+            return {start, end, start - 4, start - 1}
+        return {start, end}
+
+    def removeAttacks(self, changed):
+        # A move only changes the attacks of the pieces on the squares it changes
+        # and of the sliders whose rays reach those squares. Their attacks are
+        # removed before the move, the squares of the sliders are returned.
+        sliders = self.findSliders(changed)
+        for sq in list(changed) + sliders:
+            attacks = self.attackMap.pop(sq, None)
+            if attacks != None:
+                counts = self.attackCounts[self.board[sq >> 3][sq & 7].piece.playerColor]
+                for target in attacks:
+                    counts[target] -= 1
+        return sliders
+
+    def findSliders(self, changed):
+        # Squares of the sliders outside changed that attack one of its squares,
+        # found by walking the rays out of the changed squares to the first piece.
+        # A slider's ray goes on through the enemy king, like in getAttacks.
+        board = self.board
+        sliders = []
+        for square in changed:
+            for i, ray in enumerate(queenRays[square]):
+                # the first four directions are the diagonals
+                kinds = (Bishop, Queen) if i < 4 else (Rook, Queen)
+                king = None
+                for sq in ray:
+                    piece = board[sq >> 3][sq & 7].piece
+                    if piece == None:
+                        continue
+                    if king == None and isinstance(piece, King):
+                        king = piece
+                        continue
+                    if isinstance(piece, kinds) and (king == None or king.playerColor != piece.playerColor) \
+                            and sq not in changed and sq not in sliders:
+                        sliders.append(sq)
+                    break
+        return sliders
+
+    def addAttacks(self, squares):
+        for sq in squares:
+            piece = self.board[sq >> 3][sq & 7].piece
+            if piece != None:
+                attacks = set(piece.getAttacks(sq >> 3, sq & 7, self.board))
+                counts = self.attackCounts[piece.playerColor]
+                for target in attacks:
+                    counts[target] += 1
+                self.attackMap[sq] = attacks
+
+    def makeMove(self, move):
+        start = move & 63
+        piece = self.board[start >> 3][start & 7].piece
+        key = self.zobristKey ^ self.getStateKey() ^ self.getMoveKey(move) ^ zobrist.sideKey
+        middlegame, endgame, phase = self.getMoveScores(move)
+        changed = self.getChangedSquares(move)
+        sliders = self.removeAttacks(changed)
+        captured = piece.makeMove(move, self.board)
+        self.addAttacks(sliders)
+        self.addAttacks(changed)
+        if isinstance(piece, King):
+            self.kingSquares[piece.playerColor] = (move >> 6) & 63
+        self.undoLog.append((piece, captured, self.zobristKey, self.halfmoveClock, self.middlegame, self.endgame, self.phase))
+        self.middlegame += middlegame
+        self.endgame += endgame
+        self.phase += phase
+        self.halfmoveClock = 0 if captured != None or isinstance(piece, Pawn) else self.halfmoveClock + 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
         self.moveLog.append(move)
         self.whiteToMove = not self.whiteToMove
-        if not self.isSpecialCase(move):
-            gameController.drawGameState()
-            gameController.animatedMove(move)
+        self.zobristKey = key ^ self.getStateKey()
+        self.notify('makeMove', move)
 
-    def undoMove(self, gameController):
+    def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
-            move.pieceMoved.undoMoves(move, self.board, gameController) 
+            piece, captured, self.zobristKey, self.halfmoveClock, self.middlegame, self.endgame, self.phase = self.undoLog.pop()
+            changed = self.getChangedSquares(move)
+            sliders = self.removeAttacks(changed)
+            piece.undoMoves(move, self.board, captured)
+            self.addAttacks(sliders)
+            self.addAttacks(changed)
+            if isinstance(piece, King):
+                self.kingSquares[piece.playerColor] = move & 63
             self.whiteToMove = not self.whiteToMove
-            gameController.drawGameState()
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
+            self.gameOver = False
+            self.result = ONGOING
+            self.notify('undoMove', move)
 
-    def isSpecialCase(self, move):
-        if isinstance(move, Pawn.Move):
-            if move.pawnPromotion:
-                return True
-        return False
+    def getValidMoves(self):
+        entry = self.moveCache.probe(self.zobristKey)
+        if entry != None:
+            moves, self.inCheck = entry
+        else:
+            moves = self.generateValidMoves()
+            self.moveCache.store(self.zobristKey, moves, self.inCheck)
+        playerColor = 'w' if self.whiteToMove else 'b'
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        kingSq = self.kingSquares[playerColor]
+        self.board[kingSq >> 3][kingSq & 7].piece.kingInDanger = self.inCheck
+        enemyKingSq = self.kingSquares[enemyColor]
+        self.board[enemyKingSq >> 3][enemyKingSq & 7].piece.kingInDanger = False
+        self.result = self.getResult(moves)
+        self.gameOver = self.result != ONGOING
+        if self.gameOver:
+            self.notify('gameOver')
+        # callers may change the list they get, the cached one stays as it is
+        return moves[:]
 
-    def getValidMoves(self, gameController):
-        # 1. 0:00:00.000997  Hours
-        # 2. 0:00:00.005020  Hours
-        self.resetRange(gameController)
-        self.getAllEnemysMoves(gameController)
-        moves = self.getAllPlayerMoves()
-        for move in reversed(moves):
-            if self.isSpecialCase(move):
-                continue
-            move.pieceMoved.makeMove(move, self.board, gameController)
-            self.whiteToMove = not self.whiteToMove
-            enemyMoves = self.getAllPlayerMoves()
-            if self.validateDanger(enemyMoves):
-                moves.remove(move)
-            move.pieceMoved.undoMoves(move, self.board, gameController) 
-            self.whiteToMove = not self.whiteToMove
+    def getResult(self, moves):
+        # moves are the legal moves of the position, getValidMoves sets inCheck
         if len(moves) == 0:
-            gameController.gameOver = True
+            return CHECKMATE if self.inCheck else STALEMATE
+        if self.halfmoveClock >= 100:
+            return FIFTY_MOVES
+        if self.getRepetitions() >= 2:
+            return REPETITION
+        if self.isInsufficientMaterial():
+            return INSUFFICIENT_MATERIAL
+        return ONGOING
 
+    def getRepetitions(self):
+        # how often the position occurred before, only the positions since
+        # the last capture or pawn move and with the same side to move can repeat
+        count = 0
+        last = max(len(self.undoLog) - self.halfmoveClock, 0)
+        for i in range(len(self.undoLog) - 2, last - 1, -2):
+            if self.undoLog[i][2] == self.zobristKey:
+                count += 1
+        return count
+
+    def isInsufficientMaterial(self):
+        # kings alone, one knight or bishop, or only bishops all on squares of one color
+        minors = []
+        for sq in self.attackMap:
+            piece = self.board[sq >> 3][sq & 7].piece
+            if isinstance(piece, (Pawn, Rook, Queen)):
+                return False
+            if not isinstance(piece, King):
+                minors.append((piece, sq))
+        if len(minors) <= 1:
+            return True
+        return all(isinstance(piece, Bishop) for piece, sq in minors) \
+            and len({((sq >> 3) + (sq & 7)) % 2 for piece, sq in minors}) == 1
+
+    def generateValidMoves(self):
+        # Checkers and pins are found once per position, the attacked squares are
+        # kept up to date by makeMove, and the pseudo legal moves are filtered against them
+        playerColor = 'w' if self.whiteToMove else 'b'
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        kingSq = self.kingSquares[playerColor]
+        kingRow, kingCol = kingSq >> 3, kingSq & 7
+        attacked = self.attackCounts[enemyColor]
+        checkers = []
+        if attacked[kingSq] > 0:
+            checkers = [(sq >> 3, sq & 7) for sq, attacks in self.attackMap.items()
+                        if kingSq in attacks and self.board[sq >> 3][sq & 7].piece.playerColor == enemyColor]
+        self.inCheck = len(checkers) > 0
+        pins = self.getPins(kingRow, kingCol, playerColor)
+        checkMask = None
+        if len(checkers) == 1:
+            checkMask = {r*8 + c for r, c in self.getSquaresBetween((kingRow, kingCol), checkers[0]) + checkers}
+
+        moves = []
+        for move in self.getAllPlayerMoves():
+            start = move & 63
+            end = (move >> 6) & 63
+            flag = move >> 12
+            if start == kingSq:
+                # castling already checks the squares the king crosses
+                if flag == KING_CASTLE or flag == QUEEN_CASTLE or attacked[end] == 0:
+                    moves.append(move)
+            elif len(checkers) > 1:
+                continue
+            elif flag == EP_CAPTURE:
+                if self.isLegalEnPassant(move, kingRow, kingCol):
+                    moves.append(move)
+            elif checkMask != None and end not in checkMask:
+                continue
+            elif start in pins and end not in pins[start]:
+                continue
+            else:
+                moves.append(move)
         return moves
 
-    def validateDanger(self, enemyMoves):
-        for move in enemyMoves:
-            if move.enemyKingInRange:
-                return True
+    def findMove(self, notation):
+        for move in self.getValidMoves():
+            if getChessNotation(move) == notation:
+                return move
+        return None
+
+    def findKing(self, playerColor):
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                piece = self.board[r][c].piece
+                if isinstance(piece, King) and piece.playerColor == playerColor:
+                    return r, c
+        return None
+
+    def getSquaresBetween(self, startSq, endSq):
+        dR = endSq[0] - startSq[0]
+        dC = endSq[1] - startSq[1]
+        if dR != 0 and dC != 0 and abs(dR) != abs(dC):
+            return []
+        steps = max(abs(dR), abs(dC))
+        i, j = dR // steps, dC // steps
+        return [(startSq[0] + i*k, startSq[1] + j*k) for k in range(1, steps)]
+
+    def getPins(self, kingRow, kingCol, playerColor):
+        # maps the square of every pinned piece to the squares it can still move to
+        pins = {}
+        for direction, ray in zip(queenDirections, queenRays[kingRow*8 + kingCol]):
+            pinned = None
+            for k, sq in enumerate(ray):
+                piece = self.board[sq >> 3][sq & 7].piece
+                if piece != None:
+                    if piece.playerColor == playerColor:
+                        if pinned != None:
+                            break
+                        pinned = sq
+                    else:
+                        if pinned != None and isinstance(piece, (Rook, Bishop, Queen)) and direction in piece.directions:
+                            pins[pinned] = ray[:k + 1]
+                        break
+        return pins
+
+    def isLegalEnPassant(self, move, kingRow, kingCol):
+        # en passant removes two pieces from the board, it is simply tried out
+        start = move & 63
+        piece = self.board[start >> 3][start & 7].piece
+        captured = piece.makeMove(move, self.board)
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        legal = not self.isSquareAttacked(kingRow, kingCol, enemyColor)
+        piece.undoMoves(move, self.board, captured)
+        return legal
+
+    def isSquareAttacked(self, r, c, enemyColor):
+        for row in range(len(self.board)):
+            for col in range(len(self.board[row])):
+                piece = self.board[row][col].piece
+                if piece != None and piece.playerColor == enemyColor and r*8 + c in piece.getAttacks(row, col, self.board):
+                    return True
         return False
-    
+
     def getAllPlayerMoves(self):
         moves = []
         for r in range(len(self.board)):
@@ -94,26 +530,3 @@ class GameState():
                         moves += self.board[r][c].piece.getMoves(r, c, self.board, self)
         return moves
     
-    def getAllEnemysMoves(self, gameController):
-        moves = []
-        self.whiteToMove = not self.whiteToMove
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                if self.board[r][c] != None: 
-                    turn = self.board[r][c].piece.playerColor
-                    if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
-                        moves += self.board[r][c].piece.getMoves(r, c, self.board, self)
-        for move in moves:
-            self.board[move.endRow][move.endCol].inDanger = True
-            if move.enemyKingInRange:
-                move.pieceCaptured.kingInDanger = True
-                gameController.drawGameState()
-        self.whiteToMove = not self.whiteToMove
-        
-    def resetRange(self, gameController):
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                self.board[r][c].inDanger = False
-                if isinstance(self.board[r][c].piece, King):
-                    self.board[r][c].piece.kingInDanger = False
-        gameController.drawGameState()
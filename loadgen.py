@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import bitboard
+from pieces import getChessNotation
+
+# Load generator for server.py. Pairs of clients play random games against each
+# other over their own connections, for a fixed time. The latency of a move is
+# the time from sending it to receiving its announcement back.
+
+class LoadStats():
+
+    def __init__(self):
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.latencies = []
+
+    def report(self, seconds):
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3 if latencies else 0.0
+        print('{} moves in {} games in {:.1f}s, {:.0f} moves/s, {} errors'.format(
+            self.moves, self.games, seconds, self.moves / max(seconds, 1e-9), self.errors))
+        print('latency ms  p50 {:.2f}  p90 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+            percentile(0.5), percentile(0.9), percentile(0.99), latencies[-1] * 1e3 if latencies else 0.0))
+
+async def send(writer, message):
+    writer.write((json.dumps(message) + '\n').encode())
+    await writer.drain()
+
+async def receive(reader, kind, stats):
+    # the next message of this kind, errors are counted and skipped
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        message = json.loads(line)
+        if message['type'] == kind:
+            return message
+        if message['type'] == 'error':
+            stats.errors += 1
+
+async def playGames(host, port, stats, deadline, maxPlies, seed):
+    generator = random.Random(seed)
+    white = await asyncio.open_connection(host, port)
+    black = await asyncio.open_connection(host, port)
+    clients = (white, black)
+    try:
+        while time.monotonic() < deadline:
+            await send(white[1], {'type': 'new', 'time': 600, 'increment': 0})
+            gameId = (await receive(white[0], 'created', stats))['game']
+            await send(black[1], {'type': 'join', 'game': gameId})
+            for reader, writer in clients:
+                await receive(reader, 'start', stats)
+            position = bitboard.BitboardGameState()
+            moves = position.getValidMoves()
+            while not position.gameOver and len(position.moveLog) < maxPlies and time.monotonic() < deadline:
+                move = generator.choice(moves)
+                mover, other = (white, black) if position.whiteToMove else (black, white)
+                start = time.perf_counter()
+                await send(mover[1], {'type': 'move', 'game': gameId, 'move': getChessNotation(move)})
+                await receive(mover[0], 'move', stats)
+                stats.latencies.append(time.perf_counter() - start)
+                await receive(other[0], 'move', stats)
+                stats.moves += 1
+                position.makeMove(move)
+                moves = position.getValidMoves()
+            if not position.gameOver:
+                mover = white if position.whiteToMove else black
+                await send(mover[1], {'type': 'resign', 'game': gameId})
+            for reader, writer in clients:
+                await receive(reader, 'end', stats)
+            stats.games += 1
+    finally:
+        for reader, writer in clients:
+            writer.close()
+
+async def waitForServer(host, port, timeout=10):
+    end = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > end:
+                raise
+            await asyncio.sleep(0.1)
+
+async def runLoad(host, port, pairs, seconds, maxPlies):
+    await waitForServer(host, port)
+    stats = LoadStats()
+    start = time.monotonic()
+    deadline = start + seconds
+    await asyncio.gather(*(playGames(host, port, stats, deadline, maxPlies, seed) for seed in range(pairs)))
+    stats.report(time.monotonic() - start)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Play random games against server.py and report moves/s and latency')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pairs', type=int, default=100, help='games played at the same time')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--max-plies', type=int, default=200, help='a game is resigned after this many plies')
+    parser.add_argument('--spawn', action='store_true', help='start server.py in another process first')
+    args = parser.parse_args()
+    server = None
+    if args.spawn:
+        serverPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+        server = subprocess.Popen([sys.executable, serverPath, '--host', args.host, '--port', str(args.port)])
+    try:
+        asyncio.run(runLoad(args.host, args.port, args.pairs, args.seconds, args.max_plies))
+    finally:
+        if server != None:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
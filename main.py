@@ -1,6 +1,14 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import pygame as p
 import game
 import pieces
+import engine
+import book
+import bitboard
+import tablebase
+import metrics
+import assets
 
 class Button:
     def __init__(self, value, image, width, height, position):
@@ -21,62 +29,138 @@ class Button:
             self.position[1] < mouse_pos[1] < self.position[1] + self.height:
             return True
         return False
-    
-    def create_piece(self, color):
-        if self.value[1] == 'B':
-            return pieces.Bishop(color+self.value[1])
-        elif self.value[1] == 'Q':
-            return pieces.Queen(color+self.value[1])
-        elif self.value[1] == 'N':
-            return pieces.Knight(color+self.value[1])
-        elif self.value[1] == 'R':
-            return pieces.Rook(color+self.value[1])
-        else:
-            return None
 
 class GameController():
     
-    def __init__(self):
+    def __init__(self, playerOne=True, playerTwo=True, movetime=1.0, bookPath=None, tablebasePath=None):
+        # playerOne and playerTwo are True when a human plays white and black,
+        # the engine moves for the other side
+        self.playerOne = playerOne
+        self.playerTwo = playerTwo
+        self.movetime = movetime
+        self.engine = engine.Engine()
+        if bookPath != None:
+            self.engine.book = book.OpeningBook(bookPath)
+        if tablebasePath != None:
+            self.engine.tablebase = tablebase.Tablebase(tablebasePath)
+        # the engine searches on a background thread, run() polls the result every frame
+        self.executor = ThreadPoolExecutor(1)
+        self.search = None
         self.WIDTH = 512
         self.HEIGHT = 512
         self.DIMENSION = 8
         self.SQ_SIZE = self.HEIGHT // self.DIMENSION
         self.MAX_FPS = 15 # for animation later on
+        self.ANIMATION_FPS = 60
+        # [move, frame, frameCount] of the move being animated
+        self.animation = None
+        # Only the parts of the screen that changed are drawn and sent to the display.
+        # drawnSquares holds what every square showed when it was last drawn.
+        self.selected = None
+        self.drawnSquares = [[None] * self.DIMENSION for r in range(self.DIMENSION)]
+        self.dirtyRects = []
+        self.spriteRect = None
         self.IMAGES = {}
         self.promotion_buttons = {}
-        self.screen = p.display.set_mode((self.WIDTH, self.HEIGHT))
+        self.promotion_moves = []
+        self.moves = []
+        self.screen = p.display.set_mode((self.WIDTH, self.HEIGHT), p.RESIZABLE)
         self.clock = p.time.Clock()
         self.screen.fill(p.Color('white'))
         self.gs = game.GameState()
+        self.gs.subscribe(self.onGameEvent)
         self.board = self.gs.board
-        self.gameOver = False
         self.loadImages()
+        self.background = self.createBackground()
         p.init()
 
     def resetGame(self):
+        self.cancelSearch()
+        self.stopAnimation()
         self.promotion_buttons = {}
+        self.promotion_moves = []
         self.gs = game.GameState()
+        self.gs.subscribe(self.onGameEvent)
         self.board = self.gs.board
-        self.gameOver = False
+        self.updateValidMoves()
+
+    def updateValidMoves(self):
+        # the interface works with views of the legal moves, made before any of them is played
+        self.moves = [pieces.Move(move, self.board) for move in self.gs.getValidMoves()]
+        self.updateCaption()
+
+    def updateCaption(self):
+        # the tablebase verdict of the position while it has few enough pieces
+        if self.engine.tablebase == None:
+            return
+        value = self.engine.tablebase.probe(bitboard.unpackPosition(self.gs.packPosition()))
+        if value == None or value[0] == tablebase.ILLEGAL:
+            p.display.set_caption('Chess')
+        elif value[0] == tablebase.DRAW:
+            p.display.set_caption('Chess - tablebase draw')
+        else:
+            winner = 'White' if (value[0] == tablebase.WIN) == self.gs.whiteToMove else 'Black'
+            p.display.set_caption('Chess - {} mates in {}'.format(winner, (value[1] + 1) // 2))
+
+    def onGameEvent(self, event, move=None):
+        if event == 'makeMove':
+            for validMove in self.moves:
+                if validMove.move == move:
+                    self.animatedMove(validMove)
+            self.drawGameState()
+        elif event == 'undoMove':
+            self.stopAnimation()
+            self.drawGameState()
+
+    def startSearch(self):
+        # the search plays on its own copy of the position, the game can change meanwhile
+        position = engine.createSearchPosition(self.gs)
+        self.search = self.executor.submit(self.engine.search, position, None, self.movetime)
+
+    def cancelSearch(self):
+        if self.search != None:
+            self.search.cancel()
+            self.engine.stop()
+            self.search = None
 
     def loadImages(self):
-        pieces = ['bB', 'bK', 'bN', 'bp', 'bQ', 'bR', 'wB', 'wK', 'wN', 'wp', 'wQ', 'wR']
-        for piece in pieces:
-            self.IMAGES[piece] = p.transform.scale(p.image.load('pixel_chess/pieces/'+ piece + ".png"), (self.SQ_SIZE, self.SQ_SIZE))
+        # pre-scaled sprites of the atlas cache, see assets.py
+        self.IMAGES = assets.getSprites(self.SQ_SIZE)
+
+    def resize(self, width, height):
+        # the board keeps whole squares, every size has its own sprites
+        self.SQ_SIZE = max(min(width, height) // self.DIMENSION, 16)
+        self.WIDTH = self.HEIGHT = self.SQ_SIZE * self.DIMENSION
+        self.screen = p.display.set_mode((self.WIDTH, self.HEIGHT), p.RESIZABLE)
+        self.loadImages()
+        self.background = self.createBackground()
+        self.spriteRect = None
+        self.drawnSquares = [[None] * self.DIMENSION for r in range(self.DIMENSION)]
+        self.dirtyRects = [p.Rect(0, 0, self.WIDTH, self.HEIGHT)]
+        self.drawGameState()
+        if len(self.promotion_moves) > 0:
+            move = self.promotion_moves[0]
+            self.promotion_buttons = {}
+            self.loadButtons((move.endRow, move.endCol), move.pieceMoved.playerColor)
+            self.createButton()
 
     def run(self):
-        moves = self.gs.getValidMoves(self)
+        self.updateValidMoves()
         running = True
         moveMade = False
         sqSelected = ()
         playerClicks = []
         self.drawGameState()
         while running:
+            humanTurn = (self.gs.whiteToMove and self.playerOne) or (not self.gs.whiteToMove and self.playerTwo)
             for e in p.event.get():
                 if e.type == p.QUIT:
                     running = False
 
-                elif e.type == p.MOUSEBUTTONDOWN and not self.gameOver:
+                elif e.type == p.VIDEORESIZE:
+                    self.resize(e.w, e.h)
+
+                elif e.type == p.MOUSEBUTTONDOWN and not self.gs.gameOver and humanTurn:
                     location = p.mouse.get_pos() # (x, y) location of mouse
 
                     if len(self.promotion_buttons) <= 0:
@@ -93,15 +177,19 @@ class GameController():
 
                             if len(playerClicks) == 2: # after 2nd click
                                 move = '{}{}{}{}'.format(playerClicks[0][0], playerClicks[0][1], playerClicks[1][0], playerClicks[1][1])
-                                for validMove in moves:
-                                    if validMove.moveID == move:
-                                        print(validMove.getChessNotation())
-                                        self.gs.makeMove(validMove, self)
-                                        moveMade = True
-                                        sqSelected = ()
-                                        playerClicks = []
-                                        break
-                            if not moveMade:
+                                validMoves = [validMove for validMove in self.moves if validMove.moveID == move]
+                                if len(validMoves) == 1:
+                                    print(validMoves[0].getChessNotation())
+                                    self.gs.makeMove(validMoves[0].move)
+                                    moveMade = True
+                                elif len(validMoves) > 1: # pawn promotion, the player picks the piece
+                                    self.promotion_moves = validMoves
+                                    self.loadButtons(playerClicks[1], validMoves[0].pieceMoved.playerColor)
+                                    self.createButton()
+                                if len(validMoves) > 0:
+                                    sqSelected = ()
+                                    playerClicks = []
+                            if not moveMade and len(self.promotion_moves) <= 0:
                                 playerClicks = [sqSelected]
 
                         if len(playerClicks) == 1:
@@ -109,34 +197,53 @@ class GameController():
                             self.drawGameState(r, c,self.board[r][c].piece)
             
                     else:
-                        lastMove = self.gs.getLastMove()
-                        moveMade = self.promotionBehavior(lastMove.pieceMoved, location, lastMove)
+                        moveMade = self.promotionBehavior(location)
 
                 elif e.type == p.KEYDOWN:
-                    if e.key == p.K_z: 
-                        self.gs.undoMove(self)
+                    if e.key == p.K_z and len(self.promotion_moves) > 0:
+                        # the pawn hasn't moved yet, only the choice of the piece is cancelled
+                        self.promotion_buttons.clear()
+                        self.promotion_moves = []
+                        self.drawGameState()
+                    elif e.key == p.K_z:
+                        self.cancelSearch()
+                        self.gs.undoMove()
                         moveMade = True
-                        if self.gameOver:
-                            self.gameOver = False
                     if e.key == p.K_r:
                         self.resetGame()
-                        moves = self.gs.getValidMoves(self)
+                        self.drawGameState()
                         moveMade = False
                         sqSelected = ()
                         playerClicks = []
 
+            if not humanTurn and not moveMade and not self.gs.gameOver and running:
+                if self.search == None:
+                    self.startSearch()
+                elif self.search.done() and self.animation == None:
+                    move = self.search.result()
+                    self.search = None
+                    print(pieces.getChessNotation(move))
+                    self.gs.makeMove(move)
+                    moveMade = True
+
             if moveMade and len(self.promotion_buttons) <= 0:
-                moves = self.gs.getValidMoves(self)
+                self.updateValidMoves()
+                self.drawGameState()
                 moveMade = False
-                if self.gameOver:
-                    if self.gs.whiteToMove:
-                        text = 'Black Wins by CheckMate'
-                    else:
-                        text = 'White Wins by CheckMate'
-                    self.drawText(text)
 
-            self.clock.tick(self.MAX_FPS)
-            p.display.flip()
+            if self.animation != None:
+                self.drawAnimationFrame()
+                self.clock.tick(self.ANIMATION_FPS)
+            else:
+                self.clock.tick(self.MAX_FPS)
+            if len(self.dirtyRects) > 0:
+                p.display.update(self.dirtyRects)
+                if metrics.enabled:
+                    metrics.count('dirtyRects', len(self.dirtyRects))
+                self.dirtyRects = []
+
+        self.cancelSearch()
+        self.executor.shutdown(wait=False)
 
     def drawText(self, text):
         font = p.font.SysFont('Helvetica', 32, True, False)
@@ -145,65 +252,131 @@ class GameController():
         self.screen.blit(textObject, textLocation)
         textObject = font.render(text, 0, p.Color('yellow'))
         self.screen.blit(textObject, textLocation.move(2, 2))
+        self.invalidate(textLocation.inflate(2, 2).move(1, 1))
 
     def drawGameState(self, r=None, c=None, piece=None):
-        self.drawBoard() # draw squares on the board
-        self.drawMoveSuggestions(r, c, piece)
-        self.drawPieces() # draw pieces on top of those squares
+        # (r, c) is the selected square, its piece gets its moves suggested
+        self.selected = None
+        if piece != None and piece.playerColor == ('w' if self.gs.whiteToMove else 'b'):
+            self.selected = (r, c)
+        targets = set()
+        if self.selected != None:
+            targets = {(move.endRow, move.endCol) for move in self.moves if move.startRow == r and move.startCol == c}
 
-    def drawMoveSuggestions(self, r, c, piece):
-        if piece == None:
-            return
-        if piece.playerColor == ('w' if self.gs.whiteToMove else 'b'):
-            color = p.Color('orange')
+        # a piece is drawn 10 pixels up, into the square above it
+        dirty = set()
+        for row in range(self.DIMENSION):
+            for col in range(self.DIMENSION):
+                state = self.getSquareState(row, col, targets)
+                if state != self.drawnSquares[row][col]:
+                    self.drawnSquares[row][col] = state
+                    dirty.add((row, col))
+                    if row > 0:
+                        dirty.add((row - 1, col))
+        for row, col in dirty:
+            self.drawSquare(row, col)
+
+        if self.gs.gameOver:
+            if self.gs.result != pieces.CHECKMATE:
+                self.drawText('Draw by ' + pieces.resultNames[self.gs.result])
+            elif self.gs.whiteToMove:
+                self.drawText('Black Wins by CheckMate')
+            else:
+                self.drawText('White Wins by CheckMate')
+
+    def getDisplayedPiece(self, r, c):
+        # while a move is animated its end square still shows the captured piece
+        if self.animation != None:
+            move = self.animation[0]
+            if r == move.endRow and c == move.endCol:
+                return move.pieceCaptured if move.move >> 12 != pieces.EP_CAPTURE else None
+        return self.board[r][c].piece
+
+    def getSquareState(self, r, c, targets):
+        piece = self.getDisplayedPiece(r, c)
+        inDanger = isinstance(piece, pieces.King) and piece.kingInDanger
+        return (str(piece) if piece != None else None, inDanger, (r, c) == self.selected, (r, c) in targets)
+
+    def drawSquare(self, r, c):
+        rect = p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE, self.SQ_SIZE, self.SQ_SIZE)
+        self.screen.set_clip(rect)
+        self.screen.blit(self.background, rect, rect)
+        name, inDanger, selected, target = self.drawnSquares[r][c]
+        color = p.Color('orange')
+        if selected:
             s = p.Surface((self.SQ_SIZE, self.SQ_SIZE))
             s.set_alpha(100)
             s.fill(color)
-            self.screen.blit(s, (c*self.SQ_SIZE, r*self.SQ_SIZE))
-            for move in piece.pieceMoves:
-                p.draw.circle(self.screen, color, ((self.SQ_SIZE*move.endCol)+self.SQ_SIZE//2, (move.endRow*self.SQ_SIZE)+self.SQ_SIZE//2), 17.25)
+            self.screen.blit(s, rect)
+        if target:
+            p.draw.circle(self.screen, color, rect.center, 17.25)
+        if inDanger:
+            p.draw.rect(self.screen, p.Color('red'), rect)
+        for row in (r, r + 1):
+            piece = self.getDisplayedPiece(row, c) if row < self.DIMENSION else None
+            if piece != None:
+                self.screen.blit(self.IMAGES[str(piece)], p.Rect(c*self.SQ_SIZE, row*self.SQ_SIZE - 10, self.SQ_SIZE, self.SQ_SIZE))
+        self.screen.set_clip(None)
+        self.dirtyRects.append(rect)
+
+    def invalidate(self, rect):
+        # something was drawn over the board, the squares under rect are drawn again next time
+        self.dirtyRects.append(rect)
+        for r in range(max(rect.top // self.SQ_SIZE, 0), min((rect.bottom - 1) // self.SQ_SIZE + 1, self.DIMENSION)):
+            for c in range(max(rect.left // self.SQ_SIZE, 0), min((rect.right - 1) // self.SQ_SIZE + 1, self.DIMENSION)):
+                self.drawnSquares[r][c] = None
 
-    def drawBoard(self):
+    def redrawArea(self, rect):
+        for r in range(max(rect.top // self.SQ_SIZE, 0), min((rect.bottom - 1) // self.SQ_SIZE + 1, self.DIMENSION)):
+            for c in range(max(rect.left // self.SQ_SIZE, 0), min((rect.right - 1) // self.SQ_SIZE + 1, self.DIMENSION)):
+                if self.drawnSquares[r][c] != None:
+                    self.drawSquare(r, c)
+
+    def createBackground(self):
+        # the squares never change, they are drawn once and copied from here
         colors = [p.Color('blue'), p.Color('white')]
+        background = p.Surface((self.WIDTH, self.HEIGHT))
         for r in range(self.DIMENSION):
             for c in range(self.DIMENSION):
                 color = colors[((r + c) % 2)]
-                p.draw.rect(self.screen, color, p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE, self.SQ_SIZE, self.SQ_SIZE))
-
-    def drawPieces(self):
-        color = p.Color('red')
-        for r in range(self.DIMENSION):
-            for c in range(self.DIMENSION):
-                piece = self.board[r][c]
-                if piece.piece != None:
-                    if isinstance(piece.piece, pieces.King):
-                        if piece.piece.kingInDanger:
-                            p.draw.rect(self.screen, color, p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE, self.SQ_SIZE, self.SQ_SIZE))
-                    self.screen.blit(self.IMAGES[str(piece)], p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE - 10, self.SQ_SIZE, self.SQ_SIZE))
+                p.draw.rect(background, color, p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE, self.SQ_SIZE, self.SQ_SIZE))
+        return background
 
     def animatedMove(self, move):
-        colors = [p.Color('blue'), p.Color('white')]
+        # the animation advances one frame per pass of the main loop, so it never blocks it
+        self.stopAnimation()
+        frameCount = (abs(move.endRow - move.startRow) + abs(move.endCol - move.startCol)) * self.MAX_FPS
+        self.animation = [move, 0, frameCount]
+
+    def stopAnimation(self):
+        self.animation = None
+        if self.spriteRect != None:
+            self.redrawArea(self.spriteRect)
+            self.spriteRect = None
+
+    def drawAnimationFrame(self):
+        move, frame, frameCount = self.animation
+        # the squares under the piece of the last frame are drawn again
+        if self.spriteRect != None:
+            self.redrawArea(self.spriteRect)
+            self.spriteRect = None
+        if frame > frameCount:
+            self.animation = None
+            self.drawGameState()
+            return
         dR = move.endRow - move.startRow
         dC = move.endCol - move.startCol
-        frameCount = (abs(dR) + abs(dC)) * self.MAX_FPS
-        for frame in range(frameCount + 1):
-            r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-            self.drawBoard()
-            self.drawPieces()
-            color = colors[(move.endRow + move.endCol) % 2]
-            endSquare = p.Rect(move.endCol*self.SQ_SIZE, move.endRow*self.SQ_SIZE - 10, self.SQ_SIZE, self.SQ_SIZE)
-            p.draw.rect(self.screen, color, endSquare)
-            if move.pieceCaptured != None:
-                self.screen.blit(self.IMAGES[str(move.pieceCaptured)], endSquare)
-            self.screen.blit(self.IMAGES[str(move.pieceMoved)], p.Rect(c*self.SQ_SIZE, r*self.SQ_SIZE - 10, self.SQ_SIZE, self.SQ_SIZE))
-            p.display.flip()
-            self.clock.tick(60)
+        r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
+        self.spriteRect = p.Rect(round(c*self.SQ_SIZE), round(r*self.SQ_SIZE) - 10, self.SQ_SIZE, self.SQ_SIZE)
+        self.screen.blit(self.IMAGES[str(move.pieceMoved)], self.spriteRect)
+        self.dirtyRects.append(self.spriteRect)
+        self.animation[1] += 1
             
     def loadButtons(self, position, player):
         if len(self.IMAGES) <= 0:
             return
         pieces = ['wB', 'wQ', 'wN', 'wR', 'bB', 'bQ', 'bN', 'bR']
-        if self.gs.whiteToMove:
+        if player == 'b':
             i, j = 0, 1
         else:
             i, j = 7, -1
@@ -216,16 +389,39 @@ class GameController():
     def createButton(self):
         for button in self.promotion_buttons.values():
             button.draw(self.screen)
+            self.invalidate(p.Rect(button.position[0] - 5, button.position[1] - 10, button.width + 5, button.height + 10))
 
-    def promotionBehavior(self, piece, location, move):
+    def promotionBehavior(self, location):
         for button in self.promotion_buttons.values():
             if button.is_clicked(location):
-                piece.pawnPromotion(move, self.board, button.create_piece(button.value[0]))
-                self.promotion_buttons.clear()
-                self.drawGameState()
-                return True
+                for move in self.promotion_moves:
+                    if move.promotion == button.value[1]:
+                        self.promotion_buttons.clear()
+                        self.promotion_moves = []
+                        print(move.getChessNotation())
+                        self.gs.makeMove(move.move)
+                        return True
         return False
 
+metrics.register(GameController, 'drawGameState', 'animatedMove', 'drawAnimationFrame')
+
 if __name__ == '__main__':
-    chess = GameController()
-    chess.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', choices=['white', 'black', 'both'], help='side played by the engine')
+    parser.add_argument('--movetime', type=float, default=1.0, help='seconds the engine thinks per move')
+    parser.add_argument('--book', help='opening book of the engine, see book.py')
+    parser.add_argument('--tablebases', help='directory of endgame tables, see tablebase.py')
+    parser.add_argument('--metrics', help='write the timings of the rules and the drawing here as JSON on exit')
+    parser.add_argument('--profile', help='write a cProfile dump here on exit')
+    args = parser.parse_args()
+    if args.metrics != None or args.profile != None:
+        metrics.enable(args.profile != None)
+    chess = GameController(args.engine not in ('white', 'both'), args.engine not in ('black', 'both'), args.movetime,
+                           args.book, args.tablebases)
+    chess.run()
+    if metrics.enabled:
+        metrics.disable()
+        if args.metrics != None:
+            metrics.writeJson(args.metrics)
+        if args.profile != None:
+            metrics.writeProfile(args.profile)
\ No newline at end of file
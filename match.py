@@ -0,0 +1,215 @@
+import argparse
+import os
+import random
+import struct
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import bitboard
+import engine
+import pgn
+from pieces import ONGOING, CHECKMATE, resultNames
+from game import initialFen
+
+# Headless games between two players, spread over worker processes. A player is
+# given as 'random' or 'engine:DEPTH'. Every game is played on a BitboardGameState
+# in a worker and only its moves travel back, the games are written as PGN and to
+# a binary log:
+#   header  magic b'CGLG', start FEN length (uint16) and the FEN in utf-8
+#   game    result index in pgn.results (uint8), termination (uint8, a result
+#           constant of pieces.py), number of plies (uint16) and the moves as uint16
+# Moves fit in 16 bits, so a game of 80 moves takes 324 bytes.
+
+logMagic = b'CGLG'
+gameHeader = struct.Struct('<BBH')
+
+class RandomPlayer():
+
+    def __init__(self):
+        self.random = random.Random()
+
+    def newGame(self, seed):
+        self.random.seed(seed)
+
+    def getMove(self, position, moves):
+        return self.random.choice(moves)
+
+class EnginePlayer():
+
+    def __init__(self, depth, ttSize=1 << 16):
+        self.depth = depth
+        self.engine = engine.Engine(ttSize)
+
+    def newGame(self, seed):
+        # games don't depend on the ones the worker played before
+        self.engine.newGame()
+
+    def getMove(self, position, moves):
+        return self.engine.search(position.copy(), self.depth)
+
+def createPlayer(spec):
+    name, _, argument = spec.partition(':')
+    if name == 'random':
+        return RandomPlayer()
+    if name == 'engine':
+        return EnginePlayer(int(argument) if argument != '' else 2)
+    raise ValueError('unknown player {}'.format(spec))
+
+# players of the worker process, created once per (player number, spec) so
+# the two sides of a match of a spec against itself don't share an engine
+workerPlayers = {}
+
+def getPlayer(number, spec):
+    if (number, spec) not in workerPlayers:
+        workerPlayers[(number, spec)] = createPlayer(spec)
+    return workerPlayers[(number, spec)]
+
+def playGame(task):
+    # the first randomPlies moves are random so games between deterministic players differ
+    index, white, black, fen, randomPlies, maxPlies, seed = task
+    # the first player is white in the even games
+    players = (getPlayer(index % 2, white), getPlayer(1 - index % 2, black))
+    for player in players:
+        player.newGame(seed)
+    opening = random.Random(seed)
+    position = bitboard.BitboardGameState(fen)
+    moves = position.getValidMoves()
+    while not position.gameOver and len(position.moveLog) < maxPlies:
+        if len(position.moveLog) < randomPlies:
+            move = opening.choice(moves)
+        else:
+            move = players[0 if position.whiteToMove else 1].getMove(position, moves)
+        position.pushMove(move)
+        position.moveLog.append(move)
+        moves = position.getValidMoves()
+    if position.result == CHECKMATE:
+        result = '0-1' if position.whiteToMove else '1-0'
+    elif position.result != ONGOING:
+        result = '1/2-1/2'
+    else:
+        result = '*'
+    return index, position.moveLog, result, position.result
+
+def getTermination(termination):
+    return resultNames[termination] if termination != ONGOING else 'Max plies'
+
+def createTasks(first, second, games, fen, randomPlies, maxPlies, seed):
+    # the players change colors every game
+    for index in range(games):
+        white, black = (first, second) if index % 2 == 0 else (second, first)
+        yield (index, white, black, fen, randomPlies, maxPlies, seed * 1000003 + index)
+
+def runMatch(first, second, games, workers, fen=initialFen, randomPlies=0, maxPlies=400, seed=0):
+    # generator of (index, white, black, moves, result, termination) in the order of the games
+    tasks = createTasks(first, second, games, fen, randomPlies, maxPlies, seed)
+    if workers <= 1:
+        for task in tasks:
+            index, moves, result, termination = playGame(task)
+            yield index, task[1], task[2], moves, result, termination
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        chunksize = max(1, min(16, games // (workers * 8)))
+        for index, moves, result, termination in executor.map(playGame, tasks, chunksize=chunksize):
+            white, black = (first, second) if index % 2 == 0 else (second, first)
+            yield index, white, black, moves, result, termination
+
+def writeLogHeader(stream, fen):
+    data = fen.encode('utf-8')
+    stream.write(logMagic + struct.pack('<H', len(data)) + data)
+
+def writeLogGame(stream, moves, result, termination):
+    stream.write(gameHeader.pack(pgn.results.index(result), termination, len(moves)))
+    stream.write(array('H', moves).tobytes())
+
+def readGameLog(stream):
+    # generator of pgn.Game objects from a binary log opened in 'rb' mode
+    if stream.read(4) != logMagic:
+        raise ValueError('not a game log')
+    fen = stream.read(struct.unpack('<H', stream.read(2))[0]).decode('utf-8')
+    while True:
+        header = stream.read(gameHeader.size)
+        if len(header) < gameHeader.size:
+            return
+        result, termination, plies = gameHeader.unpack(header)
+        moves = array('H')
+        moves.frombytes(stream.read(plies * 2))
+        headers = {'Termination': getTermination(termination)}
+        if fen != initialFen:
+            headers['SetUp'] = '1'
+            headers['FEN'] = fen
+        yield pgn.Game(headers, moves.tolist(), pgn.results[result])
+
+class MatchStats():
+
+    def __init__(self, first):
+        self.first = first
+        self.games = 0
+        self.plies = 0
+        self.results = {result: 0 for result in pgn.results}
+        self.terminations = [0] * len(resultNames)
+        # wins, draws and losses of the first player
+        self.score = [0, 0, 0]
+
+    def add(self, index, moves, result, termination):
+        self.games += 1
+        self.plies += len(moves)
+        self.results[result] += 1
+        self.terminations[termination] += 1
+        if result == '1/2-1/2':
+            self.score[1] += 1
+        elif result != '*':
+            # the first player is white in the even games, the specs may be the same
+            self.score[0 if (result == '1-0') == (index % 2 == 0) else 2] += 1
+
+    def report(self, seconds):
+        print('{} games in {:.3f}s, {:.2f} games/s, {:.1f} plies per game'.format(
+            self.games, seconds, self.games / max(seconds, 1e-9), self.plies / max(self.games, 1)))
+        print('results      ' + '  '.join('{} {}'.format(result, count) for result, count in self.results.items()))
+        print('terminations ' + '  '.join('{} {}'.format(getTermination(i), count)
+                                          for i, count in enumerate(self.terminations) if count > 0))
+        print('{}  +{} ={} -{}'.format(self.first, *self.score))
+
+def main():
+    parser = argparse.ArgumentParser(description='Play games between two players and report the results')
+    parser.add_argument('first', help="'random' or 'engine:DEPTH', plays white in the even games")
+    parser.add_argument('second', help="'random' or 'engine:DEPTH'")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--fen', default=initialFen, help='position every game starts from')
+    parser.add_argument('--random-plies', type=int, default=0, help='random moves at the start of every game')
+    parser.add_argument('--max-plies', type=int, default=400, help='games are stopped unfinished after this many plies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pgn', help='write the games here')
+    parser.add_argument('--log', help='write the games here in binary form')
+    args = parser.parse_args()
+    for spec in (args.first, args.second):
+        createPlayer(spec)
+
+    stats = MatchStats(args.first)
+    pgnFile = open(args.pgn, 'w') if args.pgn != None else None
+    logFile = open(args.log, 'wb') if args.log != None else None
+    start = time.perf_counter()
+    try:
+        if logFile != None:
+            writeLogHeader(logFile, args.fen)
+        for index, white, black, moves, result, termination in runMatch(args.first, args.second, args.games, args.workers,
+                                                                         args.fen, args.random_plies, args.max_plies, args.seed):
+            stats.add(index, moves, result, termination)
+            if pgnFile != None:
+                headers = {'Event': 'Self-play', 'Round': str(index + 1), 'White': white, 'Black': black,
+                           'Termination': getTermination(termination)}
+                if args.fen != initialFen:
+                    headers['SetUp'] = '1'
+                    headers['FEN'] = args.fen
+                pgn.writeGame(pgnFile, pgn.Game(headers, moves, result))
+            if logFile != None:
+                writeLogGame(logFile, moves, result, termination)
+    finally:
+        if pgnFile != None:
+            pgnFile.close()
+        if logFile != None:
+            logFile.close()
+    stats.report(time.perf_counter() - start)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import cProfile
+import functools
+import json
+import time
+import game
+import bitboard
+from pieces import Pawn, Rook, Knight, Bishop, Queen, King
+
+# Opt-in counters and timers for the hot paths. enable() wraps the registered
+# methods with timers and disable() puts the original methods back, so while
+# metrics are disabled nothing is measured and the hot paths run unchanged.
+# The summary is exported as JSON, the optional profile as a cProfile dump that
+# pstats, snakeviz or flameprof read.
+
+enabled = False
+# name: count, for count()
+counters = {}
+# 'Class.method': [calls, total seconds, longest call in seconds]
+timers = {}
+# (class, method name) pairs that enable() wraps
+targets = []
+# (class, method name): the method in the class dict, None when it was inherited
+originals = {}
+profiler = None
+
+def register(owner, *names):
+    for name in names:
+        targets.append((owner, name))
+
+def count(name, amount=1):
+    # callers check enabled first, so a disabled counter costs a global lookup
+    counters[name] = counters.get(name, 0) + amount
+
+def createTimer(key, method):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            entry = timers.get(key)
+            if entry == None:
+                timers[key] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+    return timed
+
+def enable(profile=False):
+    global enabled, profiler
+    if enabled:
+        return
+    enabled = True
+    for owner, name in targets:
+        originals[(owner, name)] = owner.__dict__.get(name)
+        setattr(owner, name, createTimer(owner.__name__ + '.' + name, getattr(owner, name)))
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+def disable():
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    for (owner, name), method in originals.items():
+        if method == None:
+            delattr(owner, name)
+        else:
+            setattr(owner, name, method)
+    originals.clear()
+    if profiler != None:
+        profiler.disable()
+
+def reset():
+    counters.clear()
+    timers.clear()
+
+def getSummary():
+    summary = {'timers': {}, 'counters': dict(counters)}
+    for key, (calls, total, longest) in sorted(timers.items()):
+        summary['timers'][key] = {'calls': calls, 'total': total, 'mean': total / calls, 'max': longest}
+    return summary
+
+def writeJson(path):
+    with open(path, 'w') as stream:
+        json.dump(getSummary(), stream, indent=2)
+
+def writeProfile(path):
+    if profiler != None:
+        profiler.dump_stats(path)
+
+def printSummary():
+    print('{:<40} {:>10} {:>12} {:>12} {:>12}'.format('timer', 'calls', 'total ms', 'mean us', 'max us'))
+    for key, entry in getSummary()['timers'].items():
+        print('{:<40} {:>10} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+            key, entry['calls'], entry['total'] * 1e3, entry['mean'] * 1e6, entry['max'] * 1e6))
+    for name, value in sorted(counters.items()):
+        print('{:<40} {:>10}'.format(name, value))
+
+register(game.GameState, 'getValidMoves', 'getAllPlayerMoves', 'makeMove', 'undoMove')
+register(bitboard.BitboardGameState, 'getValidMoves', 'pushMove', 'popMove')
+for pieceClass in (Pawn, Rook, Knight, Bishop, Queen, King):
+    register(pieceClass, 'getMoves')
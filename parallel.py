@@ -0,0 +1,177 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import bitboard
+import engine
+import perft
+
+# Perft and search split at the root between worker processes. Positions travel
+# to the workers as BitboardGameState.packPosition tuples and moves as integers.
+
+workerEngine = None
+
+def initWorker(ttSize):
+    # every worker keeps one engine, so its transposition table survives between tasks
+    global workerEngine
+    workerEngine = engine.Engine(ttSize)
+
+def perftTask(packed, move, depth):
+    position = bitboard.unpackPosition(packed)
+    position.pushMove(move)
+    return move, perft.perft(position, depth - 1)
+
+def getDrawState(position):
+    # Keys of the positions since the last capture or pawn move and the halfmove
+    # clock, packPosition leaves them out but the search needs them to see
+    # repetitions and the fifty-move rule like the search of the first move does
+    history = position.history
+    return [entry[3] for entry in history[max(len(history) - position.halfmoveClock, 0):]], position.halfmoveClock
+
+def searchTask(packed, drawState, move, depth, alpha, beta, movetime):
+    position = bitboard.unpackPosition(packed)
+    keys, position.halfmoveClock = drawState
+    # getRepetitions only reads the keys, these entries are never popped
+    position.history = [(None, None, None, key) for key in keys]
+    score = workerEngine.searchMove(position, move, depth, alpha, beta, movetime)
+    return move, score, workerEngine.nodes
+
+def parallelDivide(position, depth, executor):
+    packed = position.packPosition()
+    futures = [executor.submit(perftTask, packed, move, depth) for move in position.getValidMoves()]
+    return dict(future.result() for future in futures)
+
+def parallelPerft(position, depth, executor):
+    if depth <= 1:
+        return perft.perft(position, depth)
+    return sum(parallelDivide(position, depth, executor).values())
+
+class ParallelSearch():
+    # The first root move is searched here with a full window to get a bound,
+    # the other root moves are searched by the workers with a null window
+    # around that bound. A move that fails high only has a lower bound, so it
+    # is searched again with an open window above the best exact score and
+    # only exact scores raise alpha.
+
+    def __init__(self, workers=None, ttSize=1 << 18):
+        self.workers = workers if workers != None else os.cpu_count()
+        self.executor = ProcessPoolExecutor(self.workers, initializer=initWorker, initargs=(ttSize,))
+        self.engine = engine.Engine(ttSize)
+        self.nodes = 0
+        self.info = None
+        self.searchInfo = []
+
+    def close(self):
+        self.executor.shutdown()
+
+    def bestMove(self, gs, depth=None, movetime=None):
+        return self.search(engine.createSearchPosition(gs), depth, movetime)
+
+    def search(self, position, maxDepth=None, movetime=None):
+        start = time.perf_counter()
+        deadline = start + movetime if movetime != None else None
+        self.nodes = 0
+        self.searchInfo = []
+        moves = position.getValidMoves()
+        if len(moves) == 0:
+            return None
+        if maxDepth == None:
+            maxDepth = engine.MAX_PLY if movetime != None else 4
+        packed = position.packPosition()
+        drawState = getDrawState(position)
+        bestMove = moves[0]
+
+        for depth in range(1, min(maxDepth, engine.MAX_PLY) + 1):
+            remaining = deadline - time.perf_counter() if deadline != None else None
+            if remaining != None and remaining <= 0:
+                break
+            ordered = self.engine.orderMoves(position, moves, bestMove, 0)
+            alpha = self.engine.searchMove(position, ordered[0], depth, -engine.INFINITY, engine.INFINITY, remaining)
+            self.nodes += self.engine.nodes
+            if alpha == None:
+                break
+            iterationBest = ordered[0]
+
+            # future: (alpha of its window, True for a null window)
+            windows = {}
+            for move in ordered[1:]:
+                future = self.executor.submit(searchTask, packed, drawState, move, depth, alpha, alpha + 1, remaining)
+                windows[future] = (alpha, True)
+            futures = list(windows)
+            aborted = False
+            while futures:
+                done, pending = wait(futures, return_when=FIRST_COMPLETED)
+                futures = list(pending)
+                for future in done:
+                    move, score, nodes = future.result()
+                    windowAlpha, nullWindow = windows.pop(future)
+                    self.nodes += nodes
+                    if score == None:
+                        aborted = True
+                    elif score <= windowAlpha:
+                        # an upper bound below a score that is already known
+                        pass
+                    elif nullWindow:
+                        # a lower bound, the real score may still beat alpha
+                        remaining = deadline - time.perf_counter() if deadline != None else None
+                        future = self.executor.submit(searchTask, packed, drawState, move, depth, alpha, engine.INFINITY, remaining)
+                        windows[future] = (alpha, False)
+                        futures.append(future)
+                    elif score > alpha:
+                        alpha = score
+                        iterationBest = move
+            if aborted:
+                break
+            bestMove = iterationBest
+            seconds = time.perf_counter() - start
+            info = {'depth': depth, 'score': alpha, 'nodes': self.nodes, 'seconds': seconds,
+                    'nps': int(self.nodes / seconds) if seconds > 0 else 0, 'pv': [bestMove]}
+            self.searchInfo.append(info)
+            if self.info != None:
+                self.info(info)
+            if abs(alpha) >= engine.MATE_BOUND:
+                break
+        return bestMove
+
+def comparePerft(fen, depth, workers):
+    position = bitboard.BitboardGameState(fen)
+    nodes, single = perft.runPerft(position, depth)
+    print('single process  nodes {}  time {:.3f}s  nps {:.0f}'.format(nodes, single, nodes / single))
+    with ProcessPoolExecutor(workers) as executor:
+        start = time.perf_counter()
+        parallelNodes = parallelPerft(position, depth, executor)
+        seconds = time.perf_counter() - start
+    print('{} workers       nodes {}  time {:.3f}s  nps {:.0f}'.format(workers, parallelNodes, seconds, parallelNodes / seconds))
+    print('speedup {:.2f}x'.format(single / seconds))
+
+def compareSearch(fen, depth, workers):
+    position = bitboard.BitboardGameState(fen)
+    single = engine.Engine(1 << 18)
+    start = time.perf_counter()
+    move = single.search(position.copy(), depth)
+    singleSeconds = time.perf_counter() - start
+    print('single process  bestmove {}  nodes {}  time {:.3f}s'.format(bitboard.getChessNotation(move), single.nodes, singleSeconds))
+    search = ParallelSearch(workers)
+    try:
+        start = time.perf_counter()
+        move = search.search(position.copy(), depth)
+        seconds = time.perf_counter() - start
+    finally:
+        search.close()
+    print('{} workers       bestmove {}  nodes {}  time {:.3f}s'.format(workers, bitboard.getChessNotation(move), search.nodes, seconds))
+    print('speedup {:.2f}x'.format(singleSeconds / seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parallel perft or search with a single process')
+    parser.add_argument('mode', choices=['perft', 'search'])
+    parser.add_argument('--fen', help='position to use, the initial position when missing')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args()
+    if args.mode == 'perft':
+        comparePerft(args.fen, args.depth, args.workers)
+    else:
+        compareSearch(args.fen, args.depth, args.workers)
+
+if __name__ == '__main__':
+    main()
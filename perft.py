@@ -0,0 +1,148 @@
+import argparse
+import time
+import game
+import bitboard
+import metrics
+from pieces import getChessNotation
+
+# Perft counts the leaf nodes of the legal move tree, the numbers below are the
+# published counts for each position and depth.
+# https://www.chessprogramming.org/Perft_Results
+positions = [
+    ('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+        {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+        {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ('illegal en passant', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1',
+        {1: 18, 2: 92, 3: 1670, 4: 10138, 6: 1134888}),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1',
+        {1: 15, 2: 126, 3: 1928, 4: 13931, 6: 1440467}),
+    ('short castling gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1',
+        {1: 15, 2: 66, 3: 1198, 4: 6399, 6: 661072}),
+    ('long castling gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1',
+        {1: 16, 2: 71, 3: 1286, 4: 7418, 6: 803711}),
+    ('castling rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1',
+        {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1',
+        {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1',
+        {1: 11, 2: 133, 3: 1442, 4: 19174, 6: 3821001}),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1',
+        {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    ('underpromotion', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1',
+        {1: 9, 2: 40, 3: 472, 4: 2661, 6: 217342}),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1',
+        {1: 2, 2: 6, 3: 13, 4: 63, 6: 2217}),
+    ('stalemate and checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1',
+        {1: 10, 2: 25, 3: 268, 4: 926, 7: 567584}),
+]
+
+backends = {
+    'object': game.GameState,
+    'bitboard': bitboard.BitboardGameState,
+}
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    # the leaves don't have to be played, counting them is enough
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+def divide(gs, depth):
+    # node count below every root move, to find the move a generator gets wrong
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[getChessNotation(move)] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+def runPerft(gs, depth):
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    return nodes, seconds
+
+def report(depth, nodes, seconds, expected=None):
+    nps = nodes / seconds if seconds > 0 else 0
+    line = 'depth {:>2}  nodes {:>10}  time {:>8.3f}s  nps {:>10.0f}'.format(depth, nodes, seconds, nps)
+    if expected != None:
+        line += '  ' + ('OK' if nodes == expected else 'FAIL expected {}'.format(expected))
+    print(line)
+
+def runSuite(backend, maxDepth):
+    failures = 0
+    totalNodes = 0
+    totalSeconds = 0
+    for name, fen, counts in positions:
+        print('{}  {}'.format(name, fen))
+        for depth in sorted(counts):
+            if depth > maxDepth:
+                break
+            nodes, seconds = runPerft(backend(fen), depth)
+            report(depth, nodes, seconds, counts[depth])
+            totalNodes += nodes
+            totalSeconds += seconds
+            if nodes != counts[depth]:
+                failures += 1
+    print('{} nodes in {:.3f}s, {:.0f} nodes/s, {} failures'.format(totalNodes, totalSeconds, totalNodes / max(totalSeconds, 1e-9), failures))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Count the leaf nodes of the move tree')
+    parser.add_argument('--fen', help='position to search, runs the test suite when missing')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help='print the node count below every root move')
+    parser.add_argument('--backend', choices=backends.keys(), default='object')
+    parser.add_argument('--metrics', help='write the timings of the move generation here as JSON')
+    parser.add_argument('--profile', help='write a cProfile dump here')
+    args = parser.parse_args()
+    if args.metrics == None and args.profile == None:
+        return run(args)
+    metrics.enable(args.profile != None)
+    try:
+        return run(args)
+    finally:
+        metrics.disable()
+        metrics.printSummary()
+        if args.metrics != None:
+            metrics.writeJson(args.metrics)
+        if args.profile != None:
+            metrics.writeProfile(args.profile)
+
+def run(args):
+    backend = backends[args.backend]
+    if args.fen == None:
+        return 1 if runSuite(backend, args.depth) else 0
+
+    if args.divide:
+        start = time.perf_counter()
+        counts = divide(backend(args.fen), args.depth)
+        seconds = time.perf_counter() - start
+        for notation in sorted(counts):
+            print('{}: {}'.format(notation, counts[notation]))
+        report(args.depth, sum(counts.values()), seconds)
+        return 0
+
+    for depth in range(1, args.depth + 1):
+        report(depth, *runPerft(backend(args.fen), depth))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
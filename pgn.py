@@ -0,0 +1,246 @@
+import argparse
+import re
+import time
+import bitboard
+from bitboard import PAWN, pieceNames
+from pieces import KING_CASTLE, QUEEN_CASTLE, CAPTURE, PROMOTION, promotionNames
+from pieces import ranksToRows, rowsToRanks, filesToCols, colsToFiles
+from game import initialFen
+
+# PGN games are read and written one at a time, so archives of any size are
+# streamed with the memory of a single game. The moves of a game are replayed
+# on a private BitboardGameState, which checks them and translates SAN.
+
+sevenTagRoster = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+results = ('1-0', '0-1', '1/2-1/2', '*')
+
+tagPattern = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+tokenPattern = re.compile(r'[{}();]|[^\s{}();]+')
+moveNumberPattern = re.compile(r'^\d+\.*')
+sanPattern = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+class Game():
+
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers != None else {}
+        self.moves = moves if moves != None else []
+        self.result = result
+        # set to a message when the FEN or a move could not be played, moves holds the ones before it
+        self.error = None
+
+    def getStartFen(self):
+        return self.headers.get('FEN', initialFen)
+
+    def createGameState(self, backend=bitboard.BitboardGameState):
+        gs = backend(self.getStartFen())
+        for move in self.moves:
+            gs.makeMove(move)
+        return gs
+
+def fromGameState(gs, headers=None, result='*'):
+    game = Game(dict(headers) if headers != None else {}, gs.moveLog[:], result)
+    if gs.startFen != None and gs.startFen != initialFen:
+        game.headers['SetUp'] = '1'
+        game.headers['FEN'] = gs.startFen
+    return game
+
+def getSquareName(sq):
+    return colsToFiles[sq % 8] + rowsToRanks[sq // 8]
+
+def getSan(position, move, moves=None):
+    # moves are the legal moves of position, the move is tried out with pushMove so nobody is notified
+    start = move & 63
+    end = (move >> 6) & 63
+    flag = move >> 12
+    if flag == KING_CASTLE:
+        san = 'O-O'
+    elif flag == QUEEN_CASTLE:
+        san = 'O-O-O'
+    elif position.squares[start] % 6 == PAWN:
+        san = colsToFiles[start % 8] + 'x' if flag & CAPTURE else ''
+        san += getSquareName(end)
+        if flag & PROMOTION:
+            san += '=' + promotionNames[flag & 3]
+    else:
+        piece = position.squares[start]
+        san = pieceNames[piece][1]
+        if moves == None:
+            moves = position.getValidMoves()
+        # other pieces of the same kind that can go to the same square
+        others = [other & 63 for other in moves if other != move and (other >> 6) & 63 == end and position.squares[other & 63] == piece]
+        if len(others) > 0:
+            if all(sq % 8 != start % 8 for sq in others):
+                san += colsToFiles[start % 8]
+            elif all(sq // 8 != start // 8 for sq in others):
+                san += rowsToRanks[start // 8]
+            else:
+                san += getSquareName(start)
+        if flag & CAPTURE:
+            san += 'x'
+        san += getSquareName(end)
+
+    position.pushMove(move)
+    color = bitboard.WHITE if position.whiteToMove else bitboard.BLACK
+    if position.isSquareAttacked(position.kingSquare(color), color ^ 1):
+        san += '#' if len(position.getValidMoves()) == 0 else '+'
+    position.popMove(move)
+    return san
+
+def parseSan(position, san):
+    # the legal move of position written as san, None when there is none or more than one
+    san = san.rstrip('+#!?')
+    moves = position.getValidMoves()
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flag = KING_CASTLE if len(san) == 3 else QUEEN_CASTLE
+        for move in moves:
+            if move >> 12 == flag:
+                return move
+        return None
+    match = sanPattern.match(san)
+    if match == None:
+        return None
+    pieceName, fromFile, fromRank, target, promotion = match.groups()
+    pieceType = 'pNBRQK'.index(pieceName) if pieceName != None else PAWN
+    end = ranksToRows[target[1]] * 8 + filesToCols[target[0]]
+    found = None
+    for move in moves:
+        start = move & 63
+        flag = move >> 12
+        if (move >> 6) & 63 != end or position.squares[start] % 6 != pieceType:
+            continue
+        if fromFile != None and start % 8 != filesToCols[fromFile]:
+            continue
+        if fromRank != None and start // 8 != ranksToRows[fromRank]:
+            continue
+        if (promotionNames[flag & 3] if flag & PROMOTION else None) != promotion:
+            continue
+        if found != None:
+            return None
+        found = move
+    return found
+
+def createGame(headers, sans, result):
+    game = Game(headers, [], result)
+    try:
+        position = bitboard.BitboardGameState(game.getStartFen())
+    except ValueError:
+        # like an illegal move, the game is reported and the games after it are still read
+        game.error = 'invalid FEN {}'.format(game.getStartFen())
+        return game
+    for san in sans:
+        move = parseSan(position, san)
+        if move == None:
+            game.error = 'illegal or ambiguous move {} at ply {}'.format(san, len(game.moves) + 1)
+            break
+        position.pushMove(move)
+        game.moves.append(move)
+    return game
+
+def readGames(stream):
+    # Generator of the games in stream, any iterable of lines such as an open file.
+    # Comments, variations and annotations are skipped.
+    headers = {}
+    sans = []
+    comment = False
+    depth = 0
+    for line in stream:
+        if not comment and depth == 0 and line.startswith('['):
+            if len(sans) > 0:
+                # the last game ended without a result
+                yield createGame(headers, sans, '*')
+                headers = {}
+                sans = []
+            match = tagPattern.match(line)
+            if match != None:
+                headers[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+            continue
+        if line.startswith('%'):
+            continue
+        for token in tokenPattern.findall(line):
+            if comment:
+                comment = token != '}'
+            elif token == '{':
+                comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif depth > 0 or token.startswith('$'):
+                continue
+            elif token in results:
+                yield createGame(headers, sans, token)
+                headers = {}
+                sans = []
+            else:
+                token = moveNumberPattern.sub('', token)
+                if token != '':
+                    sans.append(token)
+    if len(sans) > 0 or len(headers) > 0:
+        yield createGame(headers, sans, '*')
+
+def writeGame(stream, game):
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+    for name in sevenTagRoster:
+        value = headers.pop(name, '????.??.??' if name == 'Date' else '?')
+        stream.write('[{} "{}"]\n'.format(name, value.replace('\\', '\\\\').replace('"', '\\"')))
+    for name, value in headers.items():
+        stream.write('[{} "{}"]\n'.format(name, value.replace('\\', '\\\\').replace('"', '\\"')))
+    stream.write('\n')
+
+    position = bitboard.BitboardGameState(game.getStartFen())
+    tokens = []
+    for i, move in enumerate(game.moves):
+        if position.whiteToMove:
+            tokens.append('{}.'.format(position.fullmoveNumber))
+        elif i == 0:
+            tokens.append('{}...'.format(position.fullmoveNumber))
+        tokens.append(getSan(position, move))
+        position.pushMove(move)
+    tokens.append(game.result)
+
+    # lines are kept below 80 characters
+    line = ''
+    for token in tokens:
+        if len(line) + len(token) >= 80:
+            stream.write(line + '\n')
+            line = ''
+        line = line + ' ' + token if line != '' else token
+    stream.write(line + '\n\n')
+
+def writeGames(stream, games):
+    for game in games:
+        writeGame(stream, game)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the games of a PGN file and report the invalid ones')
+    parser.add_argument('pgn', help='file to read')
+    parser.add_argument('--output', help='write the valid games here in normalized form')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = 0
+    plies = 0
+    invalid = 0
+    output = open(args.output, 'w') if args.output != None else None
+    try:
+        with open(args.pgn, encoding='utf-8', errors='replace') as stream:
+            for game in readGames(stream):
+                games += 1
+                plies += len(game.moves)
+                if game.error != None:
+                    invalid += 1
+                    print('game {}: {}'.format(games, game.error))
+                elif output != None:
+                    writeGame(output, game)
+    finally:
+        if output != None:
+            output.close()
+    seconds = time.perf_counter() - start
+    print('{} games, {} moves, {} invalid in {:.3f}s, {:.0f} moves/s'.format(games, plies, invalid, seconds, plies / max(seconds, 1e-9)))
+    return 1 if invalid > 0 else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,69 +1,162 @@
-from abc import ABC, abstractmethod
+from abc import ABC
+
+# Moves are packed integers: bits 0-5 start square, bits 6-11 end square, bits 12-15 flag,
+# square = row * 8 + col. Both backends generate the same integer for the same move.
+QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EP_CAPTURE = range(6)
+# promotion flags are PROMOTION | (piece type - 1), plus CAPTURE for promotions that capture
+PROMOTION = 8
+promotionNames = 'NBRQ'
+# results of getResult in both backends, everything but CHECKMATE is a draw
+ONGOING, CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT_MATERIAL = range(6)
+resultNames = ['Ongoing', 'CheckMate', 'Stalemate', 'Repetition', 'Fifty-Move Rule', 'Insufficient Material']
+
+ranksToRows = {"1":7, "2":6, "3":5, "4":4, "5":3, "6":2, "7":1, "8":0}
+rowsToRanks = {v:k for k, v in ranksToRows.items()}
+filesToCols = {"a":0, "b":1, "c":2, "d":3, "e":4, "f":5, "g":6, "h":7}
+colsToFiles = {v:k for k, v in filesToCols.items()}
+
+def encodeMove(start, end, flag=QUIET):
+    return start | (end << 6) | (flag << 12)
+
+def getChessNotation(move):
+    start = move & 63
+    end = (move >> 6) & 63
+    notation = colsToFiles[start % 8] + rowsToRanks[start // 8] + colsToFiles[end % 8] + rowsToRanks[end // 8]
+    flag = move >> 12
+    if flag & PROMOTION:
+        notation += promotionNames[flag & 3].lower()
+    return notation
+
+def createFen(names, whiteToMove, castling, enPassant, halfmoveClock, fullmoveNumber):
+    # names holds the piece name or None for the 64 squares, castling the rights
+    # K = 1, Q = 2, k = 4, q = 8 and enPassant the square behind a double push or -1
+    rows = []
+    for r in range(8):
+        row = ''
+        empty = 0
+        for name in names[r*8:r*8 + 8]:
+            if name == None:
+                empty += 1
+                continue
+            if empty > 0:
+                row += str(empty)
+                empty = 0
+            row += name[1].upper() if name[0] == 'w' else name[1].lower()
+        if empty > 0:
+            row += str(empty)
+        rows.append(row)
+    rights = ''.join(right for right, flag in (('K', 1), ('Q', 2), ('k', 4), ('q', 8)) if castling & flag)
+    passant = colsToFiles[enPassant % 8] + rowsToRanks[enPassant // 8] if enPassant != -1 else '-'
+    return '{} {} {} {} {} {}'.format('/'.join(rows), 'w' if whiteToMove else 'b', rights if rights != '' else '-',
+                                      passant, halfmoveClock, fullmoveNumber)
+
+rookDirections = ((1,0),(-1,0),(0,1),(0,-1))
+bishopDirections = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+queenDirections = bishopDirections + rookDirections
+knightDirections = ((1,2),(-1,2),(1,-2),(-1,-2),(2,1),(-2,1),(2,-1),(-2,-1))
+
+# Lookup tables built once, indexed by square = row * 8 + col, so the move
+# generators never check the edges of the board themselves
+def createTargets(directions):
+    # squares one step away in every direction that stays on the board
+    return [tuple((r+i)*8 + c+j for i, j in directions if 0 <= r+i <= 7 and 0 <= c+j <= 7)
+            for r in range(8) for c in range(8)]
+
+def createRays(directions):
+    # one ray per direction, in the order of directions and possibly empty,
+    # with the squares ordered from the nearest to the edge of the board
+    rays = []
+    for r in range(8):
+        for c in range(8):
+            squareRays = []
+            for i, j in directions:
+                ray = []
+                row, col = r + i, c + j
+                while 0 <= row <= 7 and 0 <= col <= 7:
+                    ray.append(row*8 + col)
+                    row += i
+                    col += j
+                squareRays.append(tuple(ray))
+            rays.append(tuple(squareRays))
+    return rays
+
+knightTargets = createTargets(knightDirections)
+kingTargets = createTargets(queenDirections)
+rookRays = createRays(rookDirections)
+bishopRays = createRays(bishopDirections)
+queenRays = createRays(queenDirections)
+# square in front of a pawn, None on the last rank, and the squares it captures on
+pawnPushes = {'w': [sq - 8 if sq >= 8 else None for sq in range(64)],
+              'b': [sq + 8 if sq < 56 else None for sq in range(64)]}
+pawnCaptures = {'w': createTargets(((-1, -1), (-1, 1))), 'b': createTargets(((1, -1), (1, 1)))}
+
+def createPiece(name):
+    if name[1] == 'p':
+        return Pawn(name)
+    elif name[1] == 'R':
+        return Rook(name)
+    elif name[1] == 'N':
+        return Knight(name)
+    elif name[1] == 'B':
+        return Bishop(name)
+    elif name[1] == 'Q':
+        return Queen(name)
+    elif name[1] == 'K':
+        return King(name)
+    return None
 
 class Square():
     def __init__(self, piece=None):
         if piece == None:
             self.piece = None
-        elif piece[1] == 'p':
-            self.piece = Pawn(piece)
-        elif piece[1] == 'R':
-            self.piece = Rook(piece)
-        elif piece[1] == 'N':
-            self.piece = Knight(piece)
-        elif piece[1] == 'B':
-            self.piece = Bishop(piece)
-        elif piece[1] == 'Q':
-            self.piece = Queen(piece)
-        elif piece[1] == 'K':
-            self.piece = King(piece)
-        self.inDanger = False
+        else:
+            self.piece = createPiece(piece)
     
     def __eq__(self, value) -> bool:
         return self.piece == value
     
     def __repr__(self) -> str:
         return self.piece.__repr__()
-    
-    def resetSquare(self):
-        self.inDanger = False
 
 class Move():
-    # maps keys to values
-    # key : value
-    ranksToRows = {"1":7, "2":6, "3":5, "4":4,
-                   "5":3, "6":2, "7":1, "8":0}
-    rowsToRanks = {v:k for k, v in ranksToRows.items()}
-    filesToCols = {"a":0, "b":1, "c":2, "d":3,
-                   "e":4, "f":5, "g":6, "h":7}
-    colsToFiles = {v:k for k, v in filesToCols.items()}
-
-    def __init__(self, startSq, endSq, board):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
+    # View of a packed move for the interface, it has to be created
+    # while the move can still be played on the board
+    __slots__ = ('move', 'startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'promotion', 'moveID')
+    ranksToRows = ranksToRows
+    rowsToRanks = rowsToRanks
+    filesToCols = filesToCols
+    colsToFiles = colsToFiles
+
+    def __init__(self, move, board):
+        self.move = move
+        self.startRow, self.startCol = divmod(move & 63, 8)
+        self.endRow, self.endCol = divmod((move >> 6) & 63, 8)
+        flag = move >> 12
         self.pieceMoved = board[self.startRow][self.startCol].piece
         self.pieceCaptured = board[self.endRow][self.endCol].piece
-        self.enemyKingInRange = self.checkKing()
-        self.moveID = '{}{}{}{}'.format(self.startRow,self.startCol,self.endRow,self.endCol)
+        self.promotion = promotionNames[flag & 3] if flag & PROMOTION else None
+        clickedCol = self.endCol
+        if flag == EP_CAPTURE:
+            self.pieceCaptured = board[self.startRow][self.endCol].piece
+        elif flag == KING_CASTLE:
+            # castling is played by clicking the king and then the rook
+            clickedCol = 7
+        elif flag == QUEEN_CASTLE:
+            clickedCol = 0
+        self.moveID = '{}{}{}{}'.format(self.startRow, self.startCol, self.endRow, clickedCol)
 
     def __eq__(self, other) -> bool:
         if isinstance(other, Move):
-            return int(self.moveID) == int(other.moveID)
+            return self.move == other.move
         
     def __repr__(self) -> str:
         return str(self.moveID)
 
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        return getChessNotation(self.move)
     
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
-    
-    def checkKing(self):
-        if isinstance(self.pieceCaptured, King):
-            return True
-        return False
 
 class Pieces(ABC):
     def __init__(self, name):
@@ -71,37 +164,50 @@ class Pieces(ABC):
         self.pieceName = name[1]
         self.pieceMoves = []
 
-    @abstractmethod
     def getMoves(self, r, c, board, gameState):
-        pass
-
-    def createMoves(self, r, c, board, direction, player_color, enemy_color):
-        i = direction[0]
-        j = direction[1]
-        condition = False
-        while not condition:
-            condition = 0 > (r + i) or (r + i) > 7 or 0 > (c + j) or (c + j) > 7
-
-            if condition:
-                break
-
-            if board[r+i][c+j] != None and board[r+i][c+j].piece.playerColor == player_color:
-                break
+        # getAllPlayerMoves only asks the pieces of the side to move
+        self.pieceMoves = []
+        self.createMoves(r*8 + c, board)
+        return self.pieceMoves
 
-            self.pieceMoves.append(Move((r,c), (r+i,c+j), board))
-            if board[r+i][c+j] != None and board[r+i][c+j].piece.playerColor == enemy_color:
+    def createMoves(self, start, board):
+        # sliders, every ray ends at the first piece and captures it if it is an enemy
+        for ray in self.rays[start]:
+            for end in ray:
+                piece = board[end >> 3][end & 7].piece
+                if piece == None:
+                    self.pieceMoves.append(start | (end << 6))
+                    continue
+                if piece.playerColor != self.playerColor:
+                    self.pieceMoves.append(start | (end << 6) | (CAPTURE << 12))
                 break
 
-            i += direction[0]
-            j += direction[1]
-
-    def makeMove(self, move, board, gameController):
-        board[move.startRow][move.startCol].piece = None
-        board[move.endRow][move.endCol].piece = move.pieceMoved
-
-    def undoMoves(self, move, board, gameController):
-        board[move.startRow][move.startCol].piece = move.pieceMoved
-        board[move.endRow][move.endCol].piece = move.pieceCaptured
+    def getAttacks(self, r, c, board):
+        # The enemy king does not stop the ray, so it can't escape a check
+        # by stepping back along the line of the attack
+        attacks = []
+        for ray in self.rays[r*8 + c]:
+            for sq in ray:
+                attacks.append(sq)
+                piece = board[sq >> 3][sq & 7].piece
+                if piece != None and not (isinstance(piece, King) and piece.playerColor != self.playerColor):
+                    break
+        return attacks
+
+    def makeMove(self, move, board):
+        # returns the captured piece, undoMoves needs it to restore the board
+        start = move & 63
+        end = (move >> 6) & 63
+        captured = board[end >> 3][end & 7].piece
+        board[start >> 3][start & 7].piece = None
+        board[end >> 3][end & 7].piece = self
+        return captured
+
+    def undoMoves(self, move, board, captured):
+        start = move & 63
+        end = (move >> 6) & 63
+        board[start >> 3][start & 7].piece = self
+        board[end >> 3][end & 7].piece = captured
 
     def __repr__(self) -> str:
         return self.playerColor + self.pieceName
@@ -110,114 +216,60 @@ class Pawn(Pieces):
     def __init__(self, name):
         super().__init__(name)
 
-    class Move(Move):
-        def __init__(self, startSq, endSq, board):
-            super().__init__(startSq, endSq, board)
-            # En passant Move
-            self.enPassant = False
-            self.passantRow = None
-            self.passantCol = None
-            # Pawn promotion Move
-            self.pawnPromotion = self.canPawnPromoted()
-            self.piecePromoted = None
-
-        def canPawnPromoted(self):
-            if (self.endRow == 0 and self.pieceMoved == 'wp') or (self.endRow == 7 and self.pieceMoved == 'bp'):
-                return True
-            return False    
-
     def getMoves(self, r, c, board, gameState):
         self.pieceMoves = []
-
-        if gameState.whiteToMove:
-            if r-1 >= 0 and board[r-1][c] == None:
-                self.pieceMoves.append(self.Move((r, c), (r-1, c), board))
-
-                if r == 6 and board[r-2][c] == None:
-                    self.pieceMoves.append(self.Move((r,c), (r-2, c), board))
-
-            if c-1 >= 0 and r-1 >= 0:
-                canEnPassant = self.canEnPassant(r, c-1, gameState)
-                if board[r-1][c-1] != None:
-                    if board[r-1][c-1].piece.playerColor == 'b':
-                        self.pieceMoves.append(self.Move((r, c), (r-1, c-1), board))
-                elif canEnPassant:
-                    move = self.Move((r, c), (r-1, c-1), board)
-                    self.pieceMoves.append(self.enPassant(r,c-1, board[r][c-1].piece, move))
-
-            if c+1 <= 7 and r-1 >= 0:
-                canEnPassant = self.canEnPassant(r, c+1, gameState)
-                if board[r-1][c+1] != None:
-                    if board[r-1][c+1].piece.playerColor == 'b':
-                        self.pieceMoves.append(self.Move((r, c), (r-1,c+1), board))
-                elif canEnPassant:
-                    move = self.Move((r, c), (r-1, c+1), board)
-                    self.pieceMoves.append(self.enPassant(r, c+1, board[r][c+1].piece, move))
-
-        elif not gameState.whiteToMove:
-            if r+1 <= 7 and board[r+1][c] == None:
-                self.pieceMoves.append(self.Move((r, c), (r+1, c), board))
-
-                if r == 1 and board[r+2][c] == None:
-                    self.pieceMoves.append(self.Move((r,c), (r+2, c), board))
-
-            if c-1 >= 0 and r+1 <= 7:
-                canEnPassant = self.canEnPassant(r, c-1, gameState)
-                if board[r+1][c-1] != None:
-                    if board[r+1][c-1].piece.playerColor == 'w':
-                        self.pieceMoves.append(self.Move((r, c), (r+1, c-1), board))
-                elif canEnPassant:
-                    move = self.Move((r, c), (r+1, c-1), board)
-                    self.pieceMoves.append(self.enPassant(r, c-1, board[r][c-1].piece, move))
-
-            if c+1 <= 7 and r+1 <= 7:
-                canEnPassant = self.canEnPassant(r, c+1, gameState)
-                if board[r+1][c+1] != None:
-                    if board[r+1][c+1].piece.playerColor == 'w':
-                        self.pieceMoves.append(self.Move((r, c), (r+1,c+1), board))
-                elif canEnPassant:
-                    move = self.Move((r, c), (r+1, c+1), board)
-                    self.pieceMoves.append(self.enPassant(r, c+1, board[r][c+1].piece, move))
+        start = r*8 + c
+        push = pawnPushes[self.playerColor][start]
+        if push != None and board[push >> 3][push & 7].piece == None:
+            self.addMove(start, push, QUIET)
+            if r == (6 if self.playerColor == 'w' else 1):
+                double = pawnPushes[self.playerColor][push]
+                if board[double >> 3][double & 7].piece == None:
+                    self.pieceMoves.append(encodeMove(start, double, DOUBLE_PUSH))
+
+        passantSquare = gameState.getEnPassantSquare()
+        passant = passantSquare[0]*8 + passantSquare[1] if passantSquare != None else -1
+        for end in pawnCaptures[self.playerColor][start]:
+            piece = board[end >> 3][end & 7].piece
+            if piece != None:
+                if piece.playerColor != self.playerColor:
+                    self.addMove(start, end, CAPTURE)
+            elif end == passant:
+                self.pieceMoves.append(encodeMove(start, end, EP_CAPTURE))
 
         return self.pieceMoves 
     
-    def pawnPromotion(self, move, board, piece):
-        r = move.endRow
-        c = move.endCol
-        move.piecePromoted = piece
-        board[r][c].piece = piece
-
-    def canEnPassant(self, r, c, gameState):
-        lastMove = gameState.getLastMove()
-        if lastMove == None:
-            return False
-        lastMoveCondition = abs(lastMove.endRow - lastMove.startRow) == 2 and lastMove.pieceMoved.pieceName == 'p'
-        currentMoveCondition = lastMove.endRow == r and c == lastMove.endCol
-        playerCondition = 'b' if gameState.whiteToMove else 'w'
-        if lastMoveCondition and currentMoveCondition and lastMove.pieceMoved.playerColor == playerCondition:
-            return True
-        return False
-    
-    def enPassant(self, r, c, piece, move):
-        move.pieceCaptured = piece
-        move.passantRow = r
-        move.passantCol = c
-        move.enPassant = True
-        return move
+    def getAttacks(self, r, c, board):
+        return pawnCaptures[self.playerColor][r*8 + c]
+
+    def addMove(self, start, end, flag):
+        move = encodeMove(start, end, flag)
+        if 8 <= end < 56:
+            self.pieceMoves.append(move)
+            return
+        # One move for each piece the pawn can be promoted to, queen first
+        for promotion in (3, 2, 1, 0):
+            self.pieceMoves.append(move | ((PROMOTION | promotion) << 12))
     
-    def makeMove(self, move, board, gameController):
-        super().makeMove(move, board, gameController)
-        if move.enPassant:
-            board[move.passantRow][move.passantCol].piece = None
-        if move.canPawnPromoted():
-            gameController.loadButtons((move.endRow, move.endCol), self.playerColor)
-            gameController.createButton()
-
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
-        if move.enPassant:
-            board[move.endRow][move.endCol].piece = None
-            board[move.passantRow][move.passantCol].piece = move.pieceCaptured
+    def makeMove(self, move, board):
+        captured = super().makeMove(move, board)
+        flag = move >> 12
+        if flag == EP_CAPTURE:
+            # the captured pawn stands next to the start square
+            r, c = (move & 63) >> 3, (move >> 6) & 7
+            captured = board[r][c].piece
+            board[r][c].piece = None
+        elif flag & PROMOTION:
+            end = (move >> 6) & 63
+            board[end >> 3][end & 7].piece = createPiece(self.playerColor + promotionNames[flag & 3])
+        return captured
+
+    def undoMoves(self, move, board, captured):
+        if move >> 12 == EP_CAPTURE:
+            super().undoMoves(move, board, None)
+            board[(move & 63) >> 3][(move >> 6) & 7].piece = captured
+        else:
+            super().undoMoves(move, board, captured)
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -227,36 +279,25 @@ class Pawn(Pieces):
 
 
 class Rook(Pieces):
+    directions = rookDirections
+    rays = rookRays
+
     def __init__(self, name):
         super().__init__(name)
         self.rookMovements = []    
-
-    def getMoves(self, r, c, board, gameState):
-        self.pieceMoves = []
-        directions = ((1,0),(-1,0),(0,1),(0,-1))
-
-        if gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'w', 'b')
-
-        elif not gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'b', 'w')
-
-        return self.pieceMoves
     
     def hasRookMove(self):
         if len(self.rookMovements) >= 1:
             return True
         return False
     
-    def makeMove(self, move, board, gameController):
-        super().makeMove(move, board, gameController)
+    def makeMove(self, move, board):
         self.rookMovements.append(move)
+        return super().makeMove(move, board)
 
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
-        self.rookMovements.remove(move)
+    def undoMoves(self, move, board, captured):
+        super().undoMoves(move, board, captured)
+        self.rookMovements.pop()
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -265,35 +306,28 @@ class Rook(Pieces):
         return self.playerColor + self.pieceName
 
 class Knight(Pieces):
+    directions = knightDirections
+    targets = knightTargets
+
     def __init__(self, name):
         super().__init__(name)
 
-    def getMoves(self, r, c, board, gameState):
-        self.pieceMoves = []
-        directions = ((1,2),(-1,2),(1,-2),(-1,-2),(2,1),(-2,1),(2,-1),(-2,-1))
-
-        if gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'w', 'b')
-
-        elif not gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'b', 'w')
-
-        return self.pieceMoves
+    def getAttacks(self, r, c, board):
+        return self.targets[r*8 + c]
 
-    def createMoves(self, r, c, board, direction, player_color, enemy_color):
-        i = direction[0]
-        j = direction[1]
-        condition = 0 > (r + i) or (r + i) > 7 or 0 > (c + j) or (c + j) > 7
-        if not condition and (board[r+i][c+j] == None or board[r+i][c+j].piece.playerColor != player_color):
-            self.pieceMoves.append(Move((r,c), (r+i, c+j), board))
+    def createMoves(self, start, board):
+        for end in self.targets[start]:
+            piece = board[end >> 3][end & 7].piece
+            if piece == None:
+                self.pieceMoves.append(start | (end << 6))
+            elif piece.playerColor != self.playerColor:
+                self.pieceMoves.append(start | (end << 6) | (CAPTURE << 12))
     
-    def makeMove(self, move, board, gameController):
-        super().makeMove(move, board, gameController)
+    def makeMove(self, move, board):
+        return super().makeMove(move, board)
 
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
+    def undoMoves(self, move, board, captured):
+        super().undoMoves(move, board, captured)
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -302,28 +336,17 @@ class Knight(Pieces):
         return self.playerColor + self.pieceName
     
 class Bishop(Pieces):
+    directions = bishopDirections
+    rays = bishopRays
+
     def __init__(self, name):
         super().__init__(name)
-
-    def getMoves(self, r, c, board, gameState):
-        self.pieceMoves = []
-        directions = ((1, 1), (-1, 1), (1, -1), (-1, -1))
-
-        if gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'w', 'b')
-
-        elif not gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'b', 'w')
-
-        return self.pieceMoves
     
-    def makeMove(self, move, board, gameController):
-        super().makeMove(move, board, gameController)
+    def makeMove(self, move, board):
+        return super().makeMove(move, board)
 
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
+    def undoMoves(self, move, board, captured):
+        super().undoMoves(move, board, captured)
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -332,28 +355,17 @@ class Bishop(Pieces):
         return self.playerColor + self.pieceName
 
 class Queen(Pieces):
+    directions = queenDirections
+    rays = queenRays
+
     def __init__(self, name):
         super().__init__(name)
-
-    def getMoves(self, r, c, board, gameState):
-        self.pieceMoves = []
-        directions = ((1, 1), (-1, 1), (1, -1), (-1, -1), (1,0), (-1,0), (0,1), (0,-1))
-
-        if gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'w', 'b')
-
-        elif not gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'b', 'w')
-
-        return self.pieceMoves
     
-    def makeMove(self, move, board, gameController):
-        super().makeMove(move, board, gameController)
+    def makeMove(self, move, board):
+        return super().makeMove(move, board)
 
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
+    def undoMoves(self, move, board, captured):
+        super().undoMoves(move, board, captured)
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -362,86 +374,77 @@ class Queen(Pieces):
         return self.playerColor + self.pieceName
     
 class King(Pieces):
+    directions = queenDirections
+    targets = kingTargets
+
     def __init__(self, name):
         super().__init__(name)
         self.kingMovements = []
         self.kingInDanger = False
 
-    class Move(Move):
-        def __init__(self, startSq, endSq, board, kingSq=None, rookSq=None):
-            super().__init__(startSq, endSq, board)
-            # Castling Move
-            self.realKingRow, self.realKingCol, self.realRookRow, self.realRookCol = self.canCastling(kingSq, rookSq)
-
-        def canCastling(self, kingSq, rookSq):
-            if kingSq == None or rookSq == None:
-                return None, None, None, None
-            return kingSq[0], kingSq[1], rookSq[0], rookSq[1]
-
     def getMoves(self, r, c, board, gameState):
         self.pieceMoves = []
-        directions = ((1, 1), (-1, 1), (1, -1), (-1, -1), (1,0), (-1,0), (0,1), (0,-1))
-
-        if gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'w', 'b')
-
-        elif not gameState.whiteToMove:
-            for d in directions:
-                self.createMoves(r, c, board, d, 'b', 'w')
-            
-        self.castlingKing(r, c, board, gameState.whiteToMove)
-
+        self.createMoves(r*8 + c, board)
+        self.castlingKing(r, c, board, gameState)
         return self.pieceMoves
 
-    def createMoves(self, r, c, board, direction, player_color, enemy_color):
-        i = direction[0]
-        j = direction[1]
-        if (0 <= (r + i) <= 7 and 0 <= (c + j) <= 7) and (board[r+i][c+j] == None or board[r+i][c+j].piece.playerColor != player_color):
-            self.pieceMoves.append(self.Move((r, c), (r+i, c+j), board))
-
-    def castlingKing(self,r, c, board, whiteToMove):
-        def checkMove(j:int, finishCol, kingRow, rookRow):
+    def getAttacks(self, r, c, board):
+        return self.targets[r*8 + c]
+
+    def createMoves(self, start, board):
+        for end in self.targets[start]:
+            piece = board[end >> 3][end & 7].piece
+            if piece == None:
+                self.pieceMoves.append(start | (end << 6))
+            elif piece.playerColor != self.playerColor:
+                self.pieceMoves.append(start | (end << 6) | (CAPTURE << 12))
+    def castlingKing(self,r, c, board, gameState):
+        def checkMove(j:int, finishCol, flag):
             for i in range(c+j,finishCol,j):
                 square = board[r][i]
-                if square.inDanger:
+                if square.piece != None:
+                    return
+                # only the squares the king crosses must be safe
+                if abs(i - c) <= 2 and gameState.isAttacked(r*8 + i, enemyColor):
                     return
-                if square.piece == None:
-                    continue
-                return
             piece = board[r][finishCol].piece
-            if piece == None or piece.playerColor != playerColor or piece.hasRookMove():
+            if not isinstance(piece, Rook) or piece.playerColor != playerColor or piece.hasRookMove():
                 return
-            self.pieceMoves.append(self.Move((r, c), (r, finishCol), board, (r,kingRow),(r,rookRow)))
+            self.pieceMoves.append(encodeMove(r*8 + c, r*8 + c + 2*j, flag))
 
-        if self.hasKingMove() or self.kingInDanger or c != 4:
+        playerColor = 'w' if gameState.whiteToMove else 'b'
+        enemyColor = 'b' if gameState.whiteToMove else 'w'
+        if self.hasKingMove() or c != 4 or r != (7 if self.playerColor == 'w' else 0) or gameState.isAttacked(r*8 + c, enemyColor):
             return
         
-        playerColor = 'w' if whiteToMove else 'b'
-        checkMove(1, 7, 6, 5)
-        checkMove(-1, 0, 2, 3)
+        checkMove(1, 7, KING_CASTLE)
+        checkMove(-1, 0, QUEEN_CASTLE)
             
     def hasKingMove(self):
         if len(self.kingMovements) >= 1:
             return True
         return False
     
-    def makeMove(self, move, board, gameController):
+    def makeMove(self, move, board):
         self.kingMovements.append(move)
-        if move.realKingRow != None and move.realRookRow != None:
-            board[move.realKingRow][move.realKingCol].piece = move.pieceMoved
-            board[move.realRookRow][move.realRookCol].piece = move.pieceCaptured
-            board[move.startRow][move.startCol].piece = None
-            board[move.endRow][move.endCol].piece = None
-        else:
-            super().makeMove(move, board, gameController)
-
-    def undoMoves(self, move, board, gameController):
-        super().undoMoves(move, board, gameController)
-        self.kingMovements.remove(move)
-        if move.realKingRow != None and move.realRookRow != None:
-            board[move.realKingRow][move.realKingCol].piece = None
-            board[move.realRookRow][move.realRookCol].piece = None 
+        captured = super().makeMove(move, board)
+        flag = move >> 12
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            r = (move & 63) >> 3
+            rookCol, finishCol = (7, 5) if flag == KING_CASTLE else (0, 3)
+            board[r][finishCol].piece = board[r][rookCol].piece
+            board[r][rookCol].piece = None
+        return captured
+
+    def undoMoves(self, move, board, captured):
+        super().undoMoves(move, board, captured)
+        self.kingMovements.pop()
+        flag = move >> 12
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            r = (move & 63) >> 3
+            rookCol, finishCol = (7, 5) if flag == KING_CASTLE else (0, 3)
+            board[r][rookCol].piece = board[r][finishCol].piece
+            board[r][finishCol].piece = None
 
     def __eq__(self, value) -> bool:
         return self.playerColor + self.pieceName == value
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import bitboard
+from pieces import CHECKMATE, ONGOING, resultNames, getChessNotation
+
+# Game server over plain TCP. Every message is one JSON object on one line.
+#
+#   client                                          server
+#   {"type": "new", "time": 300, "increment": 2}    {"type": "created", "game": 1, "color": "white"}
+#   {"type": "join", "game": 1}                     {"type": "joined", "game": 1, "color": "black"}
+#                                                   {"type": "start", "game": 1, "fen": ..., "clocks": [300, 300]} to both
+#   {"type": "move", "game": 1, "move": "e2e4"}     {"type": "move", "game": 1, "move": "e2e4", "clocks": [...]} to both
+#   {"type": "resign", "game": 1}                   {"type": "end", "game": 1, "result": "0-1", "reason": ...} to both
+#                                                   {"type": "error", "message": ...} to the sender
+#
+# "new" may also give a "fen". Clocks are the seconds left of white and black,
+# the increment is added after every move. A move is checked against
+# getValidMoves and announced to both players, an "end" follows when it finishes
+# the game. A player whose time runs out loses without anybody having to move,
+# a player who disconnects loses its running games and its games nobody joined
+# yet are dropped.
+#
+# Games are kept on BitboardGameState, a position is a few lists of integers,
+# and are dropped as soon as they end.
+
+class Game():
+    __slots__ = ('id', 'position', 'players', 'clocks', 'increment', 'turnStart', 'timer')
+
+    def __init__(self, id, position, seconds, increment):
+        self.id = id
+        self.position = position
+        # connections of white and black
+        self.players = [None, None]
+        self.clocks = [float(seconds), float(seconds)]
+        self.increment = increment
+        self.turnStart = None
+        # flags the side to move when its time is up
+        self.timer = None
+
+    def getTurn(self):
+        return 0 if self.position.whiteToMove else 1
+
+class Connection():
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        # games this connection plays in, ended when it goes away
+        self.games = set()
+
+    def send(self, message):
+        # the writes of a whole batch of messages are flushed by run()
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message, separators=(',', ':')) + '\n').encode())
+
+    async def run(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    self.server.handle(self, message)
+                except (ValueError, KeyError, TypeError, IndexError) as error:
+                    self.send({'type': 'error', 'message': 'bad message: {}'.format(error)})
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.server.leave(self)
+            self.writer.close()
+
+class GameServer():
+
+    def __init__(self):
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.moves = 0
+
+    async def onConnect(self, reader, writer):
+        await Connection(self, reader, writer).run()
+
+    def handle(self, connection, message):
+        kind = message['type']
+        if kind == 'new':
+            self.newGame(connection, message)
+            return
+        game = self.games.get(message['game'])
+        if game == None:
+            connection.send({'type': 'error', 'message': 'no game {}'.format(message['game'])})
+        elif kind == 'join':
+            self.joinGame(connection, game)
+        elif kind == 'move':
+            self.playMove(connection, game, message['move'])
+        elif kind == 'resign':
+            if connection not in game.players:
+                connection.send({'type': 'error', 'message': 'not a player of game {}'.format(game.id)})
+            else:
+                winner = 1 - game.players.index(connection)
+                self.endGame(game, '1-0' if winner == 0 else '0-1', 'Resignation')
+        else:
+            connection.send({'type': 'error', 'message': 'unknown message type {}'.format(kind)})
+
+    def newGame(self, connection, message):
+        seconds = message.get('time', 300)
+        increment = message.get('increment', 0)
+        for value in (seconds, increment):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0:
+                raise ValueError('time and increment must be non-negative numbers')
+        position = bitboard.BitboardGameState(message.get('fen'))
+        game = Game(next(self.ids), position, seconds, increment)
+        game.players[0] = connection
+        connection.games.add(game)
+        self.games[game.id] = game
+        connection.send({'type': 'created', 'game': game.id, 'color': 'white'})
+
+    def joinGame(self, connection, game):
+        if game.players[1] != None:
+            connection.send({'type': 'error', 'message': 'game {} is full'.format(game.id)})
+            return
+        game.players[1] = connection
+        connection.games.add(game)
+        connection.send({'type': 'joined', 'game': game.id, 'color': 'black'})
+        self.broadcast(game, {'type': 'start', 'game': game.id, 'fen': game.position.getFen(), 'clocks': game.clocks})
+        self.startClock(game)
+
+    def playMove(self, connection, game, notation):
+        turn = game.getTurn()
+        if game.players[1] == None or game.players[turn] != connection:
+            connection.send({'type': 'error', 'message': 'not your move in game {}'.format(game.id)})
+            return
+        move = None
+        for validMove in game.position.getValidMoves():
+            if getChessNotation(validMove) == notation:
+                move = validMove
+                break
+        if move == None:
+            connection.send({'type': 'error', 'message': 'illegal move {} in game {}'.format(notation, game.id)})
+            return
+        # the clock only changes once the move is made, a failed move doesn't charge the time again
+        clock = game.clocks[turn] - (time.monotonic() - game.turnStart)
+        if clock <= 0:
+            self.flag(game)
+            return
+        game.position.makeMove(move)
+        game.clocks[turn] = clock + game.increment
+        self.moves += 1
+        self.broadcast(game, {'type': 'move', 'game': game.id, 'move': notation, 'clocks': game.clocks})
+        position = game.position
+        position.getValidMoves()
+        if position.result == CHECKMATE:
+            self.endGame(game, '0-1' if position.whiteToMove else '1-0', resultNames[CHECKMATE])
+        elif position.result != ONGOING:
+            self.endGame(game, '1/2-1/2', resultNames[position.result])
+        else:
+            self.startClock(game)
+
+    def startClock(self, game):
+        if game.timer != None:
+            game.timer.cancel()
+        game.turnStart = time.monotonic()
+        game.timer = asyncio.get_running_loop().call_later(game.clocks[game.getTurn()], self.flag, game)
+
+    def flag(self, game):
+        if game.id not in self.games:
+            return
+        turn = game.getTurn()
+        game.clocks[turn] = 0.0
+        self.endGame(game, '0-1' if turn == 0 else '1-0', 'Time forfeit')
+
+    def endGame(self, game, result, reason):
+        if game.timer != None:
+            game.timer.cancel()
+        self.broadcast(game, {'type': 'end', 'game': game.id, 'result': result, 'reason': reason,
+                              'clocks': game.clocks})
+        self.dropGame(game)
+
+    def dropGame(self, game):
+        del self.games[game.id]
+        for player in game.players:
+            if player != None:
+                player.games.discard(game)
+
+    def leave(self, connection):
+        # a game nobody joined yet is dropped, a started one is lost by the player who left
+        for game in list(connection.games):
+            if game.players[1] == None:
+                self.dropGame(game)
+            else:
+                winner = 1 - game.players.index(connection)
+                self.endGame(game, '1-0' if winner == 0 else '0-1', 'Abandoned')
+
+    def broadcast(self, game, message):
+        for player in game.players:
+            if player != None:
+                player.send(message)
+
+async def serve(host, port):
+    server = GameServer()
+    listener = await asyncio.start_server(server.onConnect, host, port)
+    print('listening on {}:{}'.format(host, port))
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Host games over TCP, see server.py for the protocol')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
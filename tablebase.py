@@ -0,0 +1,472 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import bitboard
+from bitboard import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from pieces import DOUBLE_PUSH, CAPTURE, PROMOTION
+
+# Endgame tablebases for a few pieces, generated by retrograde analysis over the
+# bitboard rules. A table holds the placements of the pieces of a material
+# signature such as 'KQvK' (white pieces, 'v', black pieces) with either side to
+# move, without castling rights or en passant. A position is first reflected so
+# the white king stands on the files a-d, without pawns also on the ranks 1-4
+# and on or below the a1-h8 diagonal. Then
+#   index = ((kings * 64 + sq0) * 64 + ...) * 2 + (0 if white is to move else 1)
+# where kings numbers the pairs of king squares that can occur and sq0, ... are
+# the squares of the other pieces in the order of the signature. Positions with
+# the colors swapped are looked up in the mirrored table, 'KvKQ' in 'KQvK'.
+#
+# Positions right after a double push that can be taken en passant aren't in
+# the table. They are solved with it as extra positions, so the en passant
+# replies are part of the values of the table, but probe() leaves them to the search.
+#
+# File layout, '<signature>.ctb':
+#   magic b'CTB2', signature length (uint8), signature, number of positions (uint32)
+#   WDL of every position in 2 bits, 4 positions per byte, the first one in the low bits
+#   DTM of every position in 1 byte, plies to mate for wins and losses
+# Values are seen from the side to move. Files are memory mapped when probed.
+
+DRAW, WIN, LOSS, ILLEGAL = range(4)
+# only used while a table is generated
+UNKNOWN = 4
+
+tableMagic = b'CTB2'
+pieceLetters = 'KQRBNP'
+letterTypes = {'K': KING, 'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT, 'P': PAWN}
+
+def parseSignature(signature):
+    # piece indices of bitboard.pieceNames in the order of the signature
+    white, black = signature.split('v')
+    return [letterTypes[letter] for letter in white] + [6 + letterTypes[letter] for letter in black]
+
+def getSignature(position):
+    sides = []
+    for offset in (0, 6):
+        sides.append(''.join(letter * position.bitboards[offset + letterTypes[letter]].bit_count() for letter in pieceLetters))
+    return 'v'.join(sides)
+
+def mirrorSignature(signature):
+    white, black = signature.split('v')
+    return black + 'v' + white
+
+def needsTable(signature):
+    # kings alone or with a single minor piece are always drawn
+    others = signature.replace('K', '').replace('v', '')
+    return not (len(others) == 0 or (len(others) == 1 and others in 'BN'))
+
+def getSubSignatures(signature):
+    # material that a capture or a promotion leads to
+    white, black = signature.split('v')
+    subs = set()
+    for side, other, isWhite in ((white, black, True), (black, white, False)):
+        for i, letter in enumerate(side):
+            if letter == 'K':
+                continue
+            rest = side[:i] + side[i + 1:]
+            subs.add(rest + 'v' + other if isWhite else other + 'v' + rest)
+            if letter == 'P':
+                for promotion in 'QRBN':
+                    promoted = ''.join(sorted(rest + promotion, key=pieceLetters.index))
+                    subs.add(promoted + 'v' + other if isWhite else other + 'v' + promoted)
+    return sorted(subs)
+
+def flipFiles(sq):
+    return sq ^ 7
+
+def flipRanks(sq):
+    return sq ^ 56
+
+def flipDiagonal(sq):
+    # reflection in the a1-h8 diagonal, a1 is square 56 and h8 square 7
+    return ((7 - (sq & 7)) << 3) | (7 - (sq >> 3))
+
+def createSymmetries(pawns):
+    # for every square of the white king, the square every square is reflected to
+    symmetries = []
+    for king in range(64):
+        mapping = list(range(64))
+        if mapping[king] & 7 > 3:
+            mapping = [flipFiles(sq) for sq in mapping]
+        # pawns only move up or down the board, it can't be turned
+        if not pawns:
+            if mapping[king] >> 3 < 4:
+                mapping = [flipRanks(sq) for sq in mapping]
+            if 7 - (mapping[king] >> 3) > mapping[king] & 7:
+                mapping = [flipDiagonal(sq) for sq in mapping]
+        symmetries.append(mapping)
+    return symmetries
+
+# [pawnless, with pawns]
+symmetries = [createSymmetries(False), createSymmetries(True)]
+
+class TableIndex():
+    # the index of the positions of a signature, see the top of the file
+
+    def __init__(self, signature):
+        self.pieces = parseSignature(signature)
+        self.whiteKing = self.pieces.index(KING)
+        self.blackKing = self.pieces.index(6 + KING)
+        self.others = [k for k in range(len(self.pieces)) if k != self.whiteKing and k != self.blackKing]
+        self.symmetries = symmetries[1 if 'P' in signature else 0]
+        kingSquares = [sq for sq in range(64) if self.symmetries[sq][sq] == sq]
+        self.kingPairs = [(white, black) for white in kingSquares for black in range(64)
+                          if black != white and not bitboard.KING_ATTACKS[white] >> black & 1]
+        self.pairIndex = {pair: i for i, pair in enumerate(self.kingPairs)}
+        self.count = len(self.kingPairs) * 64 ** len(self.others) * 2
+
+    def getSymmetry(self, squares):
+        return self.symmetries[squares[self.whiteKing]]
+
+    def getIndex(self, squares, whiteToMove):
+        # squares of the pieces in the order of the signature, the kings can't be next to each other
+        mapping = self.symmetries[squares[self.whiteKing]]
+        index = self.pairIndex[(mapping[squares[self.whiteKing]], mapping[squares[self.blackKing]])]
+        for k in self.others:
+            index = index * 64 + mapping[squares[k]]
+        return index * 2 + (0 if whiteToMove else 1)
+
+    def getSquares(self, index):
+        # the squares of the pieces and whether white is to move
+        whiteToMove = index & 1 == 0
+        rest = index >> 1
+        squares = [0] * len(self.pieces)
+        for k in reversed(self.others):
+            squares[k] = rest & 63
+            rest >>= 6
+        squares[self.whiteKing], squares[self.blackKing] = self.kingPairs[rest]
+        return squares, whiteToMove
+
+def getTablePath(directory, signature):
+    return os.path.join(directory, signature + '.ctb')
+
+class Table():
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != tableMagic:
+            raise ValueError('{} is not a tablebase file'.format(path))
+        length = self.map[4]
+        self.signature = self.map[5:5 + length].decode('ascii')
+        self.index = TableIndex(self.signature)
+        self.pieces = self.index.pieces
+        self.count = struct.unpack_from('<I', self.map, 5 + length)[0]
+        if self.count != self.index.count:
+            raise ValueError('{} has {} positions instead of {}'.format(path, self.count, self.index.count))
+        self.wdlOffset = 9 + length
+        self.dtmOffset = self.wdlOffset + (self.count + 3) // 4
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def get(self, index):
+        wdl = (self.map[self.wdlOffset + (index >> 2)] >> ((index & 3) * 2)) & 3
+        return wdl, self.map[self.dtmOffset + index]
+
+def writeTable(path, signature, wdl, dtm):
+    data = signature.encode('ascii')
+    padded = np.zeros((len(wdl) + 3) // 4 * 4, np.uint8)
+    padded[:len(wdl)] = wdl
+    packed = padded[0::4] | (padded[1::4] << 2) | (padded[2::4] << 4) | (padded[3::4] << 6)
+    with open(path, 'wb') as stream:
+        stream.write(tableMagic + bytes([len(data)]) + data + struct.pack('<I', len(wdl)))
+        stream.write(packed.tobytes())
+        stream.write(dtm.astype(np.uint8).tobytes())
+
+class Tablebase():
+    # the tables of a directory, opened when they are first needed
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        signatures = [name[:-4] for name in os.listdir(directory) if name.endswith('.ctb')]
+        # positions with more pieces don't have to be looked up
+        self.maxPieces = max((len(signature) - 1 for signature in signatures), default=0)
+
+    def close(self):
+        for table in self.tables.values():
+            if table != None:
+                table.close()
+        self.tables = {}
+
+    def getTable(self, signature):
+        if signature not in self.tables:
+            path = getTablePath(self.directory, signature)
+            self.tables[signature] = Table(path) if os.path.exists(path) else None
+        return self.tables[signature]
+
+    def probe(self, position):
+        # (wdl, dtm) of a BitboardGameState from the side to move, None when it is not in the tables
+        if position.castling != 0 or position.getEnPassantKey() != 0:
+            return None
+        if position.isInsufficientMaterial():
+            return DRAW, 0
+        signature = getSignature(position)
+        table = self.getTable(signature)
+        mirrored = False
+        if table == None:
+            table = self.getTable(mirrorSignature(signature))
+            mirrored = True
+            if table == None:
+                return None
+        squares = []
+        bitboards = position.bitboards
+        taken = {}
+        for piece in table.pieces:
+            # the colors are swapped and the board turned upside down for a mirrored table
+            bb = bitboards[(piece + 6) % 12] if mirrored else bitboards[piece]
+            # pieces of the same kind take the squares in order
+            for i in range(taken.get(piece, 0)):
+                bb &= bb - 1
+            taken[piece] = taken.get(piece, 0) + 1
+            sq = (bb & -bb).bit_length() - 1
+            squares.append(sq ^ 56 if mirrored else sq)
+        return table.get(table.index.getIndex(squares, position.whiteToMove != mirrored))
+
+def placePieces(position, pieces, squares, whiteToMove):
+    # sets up the position for a table index, False if it can't occur in a game
+    if len(set(squares)) != len(squares):
+        return False
+    position.bitboards = [0] * 12
+    position.occupancy = [0, 0]
+    position.squares = [-1] * 64
+    for piece, sq in zip(pieces, squares):
+        if piece % 6 == PAWN and (sq < 8 or sq >= 56):
+            return False
+        position.putPiece(piece, sq)
+    position.whiteToMove = whiteToMove
+    position.castling = 0
+    position.enPassant = -1
+    position.history = []
+    position.halfmoveClock = 0
+    position.zobristKey = 0
+    # the side that just moved can't be in check
+    moved = 1 if whiteToMove else 0
+    return not position.isSquareAttacked(position.kingSquare(moved), moved ^ 1)
+
+workerTablebase = None
+
+def initWorker(directory):
+    # captures and promotions are looked up in the tables that are already there
+    global workerTablebase
+    workerTablebase = Tablebase(directory)
+
+class TableScan():
+    # Plays every legal move of the positions start to end - 1. Moves that stay in the
+    # table become edges (owners, children) between entries. The others leave the table
+    # and are looked up right away: extWin is the shortest win they give, extLoss the
+    # longest loss, and extNonWin tells if one of them doesn't lose.
+    #
+    # The positions of the range are the entries 0 to end - start - 1, the en passant
+    # positions their moves lead to get the entries after them. A child is the index
+    # of a table position, or -1 - n for the nth en passant position.
+
+    def __init__(self, signature, start, end):
+        self.index = TableIndex(signature)
+        self.start = start
+        self.end = end
+        count = end - start
+        self.status = array('B', [UNKNOWN]) * count
+        self.extWin = array('B', [255]) * count
+        self.extLoss = array('B', [0]) * count
+        self.extNonWin = array('B', [0]) * count
+        self.owners = array('i')
+        self.children = array('i')
+        # (index without the en passant square, en passant square), reflected like the index
+        self.passantKeys = []
+        self.passantNumbers = {}
+        self.position = bitboard.BitboardGameState()
+
+    def run(self):
+        for index in range(self.start, self.end):
+            squares, whiteToMove = self.index.getSquares(index)
+            if placePieces(self.position, self.index.pieces, squares, whiteToMove):
+                self.scanPosition(index - self.start, squares)
+            else:
+                self.status[index - self.start] = ILLEGAL
+        return (np.frombuffer(self.status, np.uint8), np.frombuffer(self.extWin, np.uint8),
+                np.frombuffer(self.extLoss, np.uint8), np.frombuffer(self.extNonWin, np.uint8).astype(bool),
+                np.frombuffer(self.owners, np.int32), np.frombuffer(self.children, np.int32), self.passantKeys)
+
+    def scanPosition(self, entry, squares):
+        position = self.position
+        moves = position.getValidMoves()
+        if len(moves) == 0:
+            self.status[entry] = LOSS if position.inCheck else DRAW
+            return
+        for move in moves:
+            if (move >> 12) & (CAPTURE | PROMOTION):
+                position.pushMove(move)
+                value = workerTablebase.probe(position)
+                position.popMove(move)
+                if value == None:
+                    raise ValueError('the table of {} is missing'.format(getSignature(position)))
+                wdl, dtm = value
+                if wdl == LOSS:
+                    self.extWin[entry] = min(self.extWin[entry], dtm + 1)
+                elif wdl == WIN:
+                    self.extLoss[entry] = max(self.extLoss[entry], dtm + 1)
+                if wdl != WIN:
+                    self.extNonWin[entry] = 1
+                continue
+            childSquares = squares[:]
+            childSquares[squares.index(move & 63)] = (move >> 6) & 63
+            child = None
+            if move >> 12 == DOUBLE_PUSH:
+                position.pushMove(move)
+                if position.getEnPassantKey() != 0:
+                    child = -1 - self.getPassantNumber(childSquares)
+                position.popMove(move)
+            if child == None:
+                child = self.index.getIndex(childSquares, not position.whiteToMove)
+            self.owners.append(entry)
+            self.children.append(child)
+
+    def getPassantNumber(self, squares):
+        # number of the en passant position that was just pushed, scanned when it is new
+        position = self.position
+        key = (self.index.getIndex(squares, position.whiteToMove), self.index.getSymmetry(squares)[position.enPassant])
+        number = self.passantNumbers.get(key)
+        if number == None:
+            number = len(self.passantKeys)
+            self.passantKeys.append(key)
+            self.passantNumbers[key] = number
+            self.status.append(UNKNOWN)
+            self.extWin.append(255)
+            self.extLoss.append(0)
+            self.extNonWin.append(0)
+            self.scanPosition(self.end - self.start + number, squares)
+        return number
+
+def scanTask(signature, start, end):
+    return TableScan(signature, start, end).run()
+
+def mergeScans(ranges, results, count):
+    # Joins the scans of the ranges into one graph. The en passant positions get the
+    # entries after the table, one per key even when several ranges found it.
+    passantEntries = {}
+    status, extWin, extLoss, extNonWin, owners, children = [], [], [], [], [], []
+    passantParts = []
+    for (signature, start, end), result in zip(ranges, results):
+        rangeStatus, rangeExtWin, rangeExtLoss, rangeExtNonWin, rangeOwners, rangeChildren, keys = result
+        size = end - start
+        entries = np.zeros(len(keys), np.int64)
+        new = np.zeros(len(keys), bool)
+        for number, key in enumerate(keys):
+            if key not in passantEntries:
+                passantEntries[key] = count + len(passantEntries)
+                new[number] = True
+            entries[number] = passantEntries[key]
+        # entry of the range: index of the table or entry of the en passant position
+        ownerEntries = np.concatenate((np.arange(start, end, dtype=np.int64), entries))
+        keep = np.concatenate((np.ones(size, bool), new))[rangeOwners]
+        rangeChildren = rangeChildren.astype(np.int64)
+        passant = rangeChildren < 0
+        rangeChildren[passant] = entries[-1 - rangeChildren[passant]]
+        owners.append(ownerEntries[rangeOwners][keep])
+        children.append(rangeChildren[keep])
+        status.append(rangeStatus[:size])
+        extWin.append(rangeExtWin[:size])
+        extLoss.append(rangeExtLoss[:size])
+        extNonWin.append(rangeExtNonWin[:size])
+        passantParts.append(tuple(part[size:][new] for part in (rangeStatus, rangeExtWin, rangeExtLoss, rangeExtNonWin)))
+    for part in passantParts:
+        for values, extra in zip((status, extWin, extLoss, extNonWin), part):
+            values.append(extra)
+    return tuple(np.concatenate(values) for values in (status, extWin, extLoss, extNonWin, owners, children))
+
+def solveTable(status, extWin, extLoss, extNonWin, owners, children):
+    # Positions are solved by the number of plies to mate. A position wins in d plies
+    # when a move leads to a loss in d - 1 and loses in d when all its moves lead to
+    # wins and the longest one is d - 1. What is left at the end is drawn.
+    count = len(status)
+    wdl = status.copy()
+    dtm = np.zeros(count, np.uint8)
+    degrees = np.bincount(owners, minlength=count)
+    unknown = wdl == UNKNOWN
+    external = max(int(extWin[extWin != 255].max(initial=0)), int(extLoss.max(initial=0)))
+    depth = 0
+    lastChange = 0
+    while depth <= lastChange + 1 or depth <= external:
+        depth += 1
+        if depth > 255:
+            raise ValueError('mates longer than 255 plies do not fit')
+        childWdl = wdl[children]
+        if depth % 2 == 1:
+            lost = (childWdl == LOSS) & (dtm[children] == depth - 1)
+            solved = unknown & ((np.bincount(owners[lost], minlength=count) > 0) | (extWin == depth))
+            wdl[solved] = WIN
+        else:
+            wins = np.bincount(owners[childWdl == WIN], minlength=count)
+            solved = unknown & (wins == degrees) & ~extNonWin & (extLoss <= depth)
+            wdl[solved] = LOSS
+        dtm[solved] = depth
+        unknown &= ~solved
+        if solved.any():
+            lastChange = depth
+    wdl[unknown] = DRAW
+    return wdl, dtm
+
+def generateTable(signature, directory, workers=None):
+    # tables of the material a capture or a promotion leads to are generated first
+    for sub in getSubSignatures(signature):
+        if needsTable(sub) and not os.path.exists(getTablePath(directory, sub)) \
+                and not os.path.exists(getTablePath(directory, mirrorSignature(sub))):
+            generateTable(sub, directory, workers)
+    start = time.perf_counter()
+    workers = workers if workers != None else os.cpu_count()
+    count = TableIndex(signature).count
+    chunk = max(1024, count // (workers * 16))
+    ranges = [(signature, first, min(first + chunk, count)) for first in range(0, count, chunk)]
+    if workers <= 1:
+        initWorker(directory)
+        results = [scanTask(*task) for task in ranges]
+    else:
+        with ProcessPoolExecutor(workers, initializer=initWorker, initargs=(directory,)) as executor:
+            results = list(executor.map(scanTask, *zip(*ranges)))
+    graph = mergeScans(ranges, results, count)
+    del results
+    wdl, dtm = solveTable(*graph)
+    # the en passant positions after the table aren't stored
+    wdl = wdl[:count]
+    dtm = dtm[:count]
+    writeTable(getTablePath(directory, signature), signature, wdl, dtm)
+    legal = wdl != ILLEGAL
+    print('{}  {} positions  wins {}  draws {}  losses {}  longest mate {} plies  {:.1f}s'.format(
+        signature, int(legal.sum()), int((wdl == WIN).sum()), int((wdl == DRAW).sum()), int((wdl == LOSS).sum()),
+        int(dtm[legal].max(initial=0)), time.perf_counter() - start))
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame tables or look a position up')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate = subparsers.add_parser('generate')
+    generate.add_argument('signatures', nargs='+', help="material such as 'KQvK', white pieces first")
+    generate.add_argument('--directory', default='tablebases')
+    generate.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    probe = subparsers.add_parser('probe')
+    probe.add_argument('fen')
+    probe.add_argument('--directory', default='tablebases')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        os.makedirs(args.directory, exist_ok=True)
+        for signature in args.signatures:
+            generateTable(signature, args.directory, args.workers)
+    else:
+        tablebase = Tablebase(args.directory)
+        value = tablebase.probe(bitboard.BitboardGameState(args.fen))
+        if value == None:
+            print('not in the tables')
+        else:
+            wdl, dtm = value
+            print(['draw', 'win', 'loss', 'illegal'][wdl] + (' in {} plies'.format(dtm) if wdl in (WIN, LOSS) else ''))
+        tablebase.close()
+
+if __name__ == '__main__':
+    main()
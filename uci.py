@@ -0,0 +1,229 @@
+import argparse
+import queue
+import sys
+import threading
+import bitboard
+import engine
+import tablebase
+from engine import MATE, MATE_BOUND, MAX_PLY
+from pieces import getChessNotation
+
+# Universal Chess Interface over stdin and stdout, so GUIs and tournament
+# managers can run the engine as a subprocess. A thread reads stdin and passes
+# the commands to the main thread, which plays and searches them. The "go"
+# commands are numbered as they are read, a "stop" or "quit" is meant for the
+# last one before it. If that search is running it is stopped straight from the
+# reader thread and notices it within 1024 nodes, if it is still queued it
+# stops when it starts. Supported:
+#   uci, isready, ucinewgame, setoption (Hash, BookFile, TablebasePath),
+#   position startpos|fen <fen> [moves ...], stop, quit
+#   go [depth N] [movetime MS] [wtime MS btime MS winc MS binc MS movestogo N] [infinite]
+
+engineName = 'Project Chess'
+# a table entry with its tuple and integers takes about this many bytes
+entryBytes = 128
+defaultHash = 128
+
+def getScoreText(score):
+    if score >= MATE_BOUND:
+        return 'mate {}'.format((MATE - score + 1) // 2)
+    if score <= -MATE_BOUND:
+        return 'mate {}'.format(-((MATE + score) // 2))
+    return 'cp {}'.format(score)
+
+def getMoveTime(options, whiteToMove):
+    # seconds for this move out of the clock, None when the search isn't timed
+    if 'movetime' in options:
+        return options['movetime'] / 1000
+    left = options.get('wtime' if whiteToMove else 'btime')
+    if left == None:
+        return None
+    increment = options.get('winc' if whiteToMove else 'binc', 0)
+    movesToGo = options.get('movestogo', 30)
+    seconds = (left / max(movesToGo, 1) + increment * 0.8) / 1000
+    # something is always left for the moves after this one and the overhead of the pipe
+    return max(0.01, min(seconds, left / 2000 - 0.05))
+
+class UciEngine():
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.engine = engine.Engine((defaultHash << 20) // entryBytes)
+        self.engine.info = self.sendInfo
+        self.position = bitboard.BitboardGameState()
+        self.commands = queue.Queue()
+        # numbers of the last "go" read, the one the main thread runs and the last one stopped
+        self.stateLock = threading.Lock()
+        self.readSearch = 0
+        self.runningSearch = 0
+        self.stoppedSearch = 0
+        # set when the running search is stopped, an infinite search waits for it before answering
+        self.stopEvent = threading.Event()
+        self.searching = False
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def readInput(self, stream):
+        for line in stream:
+            command = line.strip()
+            if command.split()[:1] == ['go']:
+                with self.stateLock:
+                    self.readSearch += 1
+            elif command == 'stop' or command == 'quit':
+                self.stopSearch()
+            elif command == 'isready' and self.searching:
+                # a search keeps the main thread busy, but it's stopped from here
+                self.send('readyok')
+                continue
+            self.commands.put(command)
+        self.stopSearch()
+        self.commands.put('quit')
+
+    def stopSearch(self):
+        # stops the last search that was read, an earlier one still queued runs as asked
+        with self.stateLock:
+            self.stoppedSearch = self.readSearch
+            if self.searching and self.runningSearch == self.stoppedSearch:
+                self.stopEvent.set()
+                self.engine.stop()
+
+    def run(self, stream=sys.stdin):
+        threading.Thread(target=self.readInput, args=(stream,), daemon=True).start()
+        while True:
+            command = self.commands.get()
+            if command == 'quit':
+                break
+            try:
+                self.handle(command)
+            except (ValueError, IndexError, KeyError) as error:
+                # a bad command is reported, the engine keeps running under its GUI
+                self.send('info string bad command {}: {}'.format(command, error))
+
+    def handle(self, command):
+        words = command.split()
+        if len(words) == 0:
+            return
+        name = words[0]
+        if name == 'uci':
+            self.send('id name ' + engineName)
+            self.send('id author Project Chess authors')
+            self.send('option name Hash type spin default {} min 1 max 4096'.format(defaultHash))
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif name == 'isready':
+            self.send('readyok')
+        elif name == 'ucinewgame':
+            self.engine.newGame()
+            self.position = bitboard.BitboardGameState()
+        elif name == 'setoption':
+            self.setOption(words[1:])
+        elif name == 'position':
+            self.setPosition(words[1:])
+        elif name == 'go':
+            self.go(words[1:])
+        elif name == 'stop':
+            # the search already stopped or never ran
+            pass
+        else:
+            self.send('info string unknown command ' + command)
+
+    def setOption(self, words):
+        # setoption name <name> value <value>, names and values may contain spaces
+        if 'name' not in words:
+            return
+        valueIndex = words.index('value') if 'value' in words else len(words)
+        name = ' '.join(words[words.index('name') + 1:valueIndex]).lower()
+        value = ' '.join(words[valueIndex + 1:])
+        try:
+            if name == 'hash':
+                self.engine.tt = engine.TranspositionTable((int(value) << 20) // entryBytes)
+            elif name == 'bookfile':
+                import book
+                self.engine.book = book.OpeningBook(value) if value not in ('', '<empty>') else None
+            elif name == 'tablebasepath':
+                self.engine.tablebase = tablebase.Tablebase(value) if value not in ('', '<empty>') else None
+            else:
+                self.send('info string unknown option ' + name)
+        except (ValueError, OSError) as error:
+            self.send('info string option {} not set: {}'.format(name, error))
+
+    def setPosition(self, words):
+        if 'moves' in words:
+            movesIndex = words.index('moves')
+        else:
+            movesIndex = len(words)
+        if len(words) > 0 and words[0] == 'fen':
+            fen = ' '.join(words[1:movesIndex])
+        else:
+            fen = None
+        position = bitboard.BitboardGameState(fen)
+        for notation in words[movesIndex + 1:]:
+            move = position.findMove(notation)
+            if move == None:
+                self.send('info string illegal move ' + notation)
+                break
+            position.makeMove(move)
+        self.position = position
+
+    def go(self, words):
+        # counted before the words are read, like the reader thread counts every "go"
+        with self.stateLock:
+            self.runningSearch += 1
+            number = self.runningSearch
+        options = {}
+        infinite = False
+        i = 0
+        while i < len(words):
+            if words[i] in ('infinite', 'ponder'):
+                infinite = True
+                i += 1
+            elif words[i] in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo') and i + 1 < len(words):
+                options[words[i]] = int(words[i + 1])
+                i += 2
+            else:
+                i += 1
+        if infinite:
+            depth = MAX_PLY
+            movetime = None
+        else:
+            depth = options.get('depth')
+            movetime = getMoveTime(options, self.position.whiteToMove)
+            if depth == None and movetime == None:
+                depth = MAX_PLY
+        with self.stateLock:
+            self.searching = True
+            # a "stop" that was read while this search was still queued
+            if self.stoppedSearch == number:
+                self.stopEvent.set()
+            else:
+                self.stopEvent.clear()
+        try:
+            move = self.engine.bestMove(self.position, depth, movetime)
+            if infinite:
+                # the answer of an infinite search waits for "stop"
+                self.stopEvent.wait()
+        finally:
+            with self.stateLock:
+                self.searching = False
+        self.send('bestmove ' + (getChessNotation(move) if move != None else '0000'))
+
+    def sendInfo(self, info):
+        # a "stop" for this search that came before bestMove reset the stop flag
+        if self.stopEvent.is_set():
+            self.engine.stop()
+        pv = ' '.join(getChessNotation(move) for move in info['pv'])
+        self.send('info depth {} score {} nodes {} nps {} time {} pv {}'.format(
+            info['depth'], getScoreText(info['score']), info['nodes'], info['nps'], int(info['seconds'] * 1000), pv))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the engine over the Universal Chess Interface on stdin and stdout')
+    parser.parse_args()
+    UciEngine().run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import random
+
+# Random keys for Zobrist hashing. The seed is fixed so every run and every
+# process gives a position the same key, both backends share these keys.
+generator = random.Random(20240101)
+
+pieceNames = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+# key of every piece on every square, square = row * 8 + col
+pieceKeys = {name: [generator.getrandbits(64) for sq in range(64)] for name in pieceNames}
+# xor'ed in when black is to move
+sideKey = generator.getrandbits(64)
+# one key for every combination of the castling rights K = 1, Q = 2, k = 4, q = 8
+castlingKeys = [generator.getrandbits(64) for rights in range(16)]
+# file of the en passant square, only used when a pawn can capture there
+enPassantKeys = [generator.getrandbits(64) for col in range(8)]